@@ -0,0 +1,101 @@
+import sys
+import os
+
+#adding path to the some modules
+for modules in ['.', 'forwardpass']:
+    path = os.path.abspath(modules)
+    sys.path.append(path)
+
+import argparse
+import time
+import numpy as np
+import shapefile as shp
+from get_land_usage import create_search_tree, find_usetypes_inside_bb, check_if_usable, use_list
+
+
+# legacy implementation (four fixed quadrants, linear scan over bbox keys), kept as baseline
+def legacy_overlaps(bbox1, bbox2):
+    if (bbox1[0] <= bbox2[0] <= bbox1[2] and bbox1[1] <= bbox2[1] <= bbox1[3])\
+        or (bbox1[0] <= bbox2[2] <= bbox1[2] and bbox1[1] <= bbox2[3] <= bbox1[3])\
+            or (bbox1[0] <= bbox2[0] <= bbox1[2] and bbox1[1] <= bbox2[3] <= bbox1[3])\
+                or (bbox1[0] <= bbox2[2] <= bbox1[2] and bbox1[1] <= bbox2[1] <= bbox1[3]):
+        return True
+    else:
+        return False
+
+def legacy_create_search_tree(shapefile):
+    threshold_x = (shapefile.bbox[2] - shapefile.bbox[0]) / 2 + shapefile.bbox[0]
+    threshold_y = (shapefile.bbox[3] - shapefile.bbox[1]) / 2 + shapefile.bbox[1]
+    q3 = (shapefile.bbox[0], shapefile.bbox[1], threshold_x, threshold_y)
+    q2 = (shapefile.bbox[0], threshold_y, threshold_x, shapefile.bbox[3])
+    q4 = (threshold_x, shapefile.bbox[1], shapefile.bbox[2], threshold_y)
+    q1 = (threshold_x, threshold_y, shapefile.bbox[2], shapefile.bbox[3])
+    tree = {q3: {}, q2: {}, q4: {}, q1: {}}
+    for shape in shapefile.shapeRecords():
+        bbox = tuple(shape.shape.bbox)
+        lower = (q3 if bbox[1] <= threshold_y else q2) if bbox[0] <= threshold_x else (q4 if bbox[1] <= threshold_y else q1)
+        tree[lower][bbox] = shape.record.nutzart
+        if bbox[2] <= threshold_x:
+            if bbox[3] > threshold_y:
+                tree[q2][bbox] = shape.record.nutzart
+        else:
+            tree[q4 if bbox[3] <= threshold_y else q1][bbox] = shape.record.nutzart
+    return tree
+
+def legacy_find_usetype_inside_bb(bbox, use_list, tree):
+    use = False
+    for key in tree.keys():
+        if legacy_overlaps(key, bbox):
+            for key2 in tree[key].keys():
+                if legacy_overlaps(key2, bbox):
+                    if check_if_usable(tree[key][key2], use_list):
+                        use = True
+    return use
+
+
+def random_bboxes(bounds, n, size, seed=0):
+    """ n random square bboxes (xmin, ymin, xmax, ymax) of size m inside bounds. """
+    rng = np.random.default_rng(seed)
+    x = rng.uniform(bounds[0], bounds[2] - size, n)
+    y = rng.uniform(bounds[1], bounds[3] - size, n)
+    return [(x_i, y_i, x_i + size, y_i + size) for x_i, y_i in zip(x, y)]
+
+def benchmark(shapefile_path, n, size):
+    """ Builds both search trees of a district shapefile and checks n random bboxes with both. """
+    shapefile = shp.Reader(shapefile_path)
+    bboxes = random_bboxes(shapefile.bbox, n, size)
+
+    timer = time.time()
+    legacy_tree = legacy_create_search_tree(shapefile)
+    legacy_build = time.time() - timer
+    timer = time.time()
+    legacy = [legacy_find_usetype_inside_bb(bbox, use_list, legacy_tree) for bbox in bboxes]
+    legacy_query = time.time() - timer
+
+    timer = time.time()
+    search_tree = create_search_tree(shapefile)
+    build = time.time() - timer
+    results = {}
+    for exact in (False, True):
+        timer = time.time()
+        results[exact] = [any(check_if_usable(use_type, use_list) for use_type in find_usetypes_inside_bb(bbox, search_tree, exact))
+                          for bbox in bboxes]
+        results[f'{exact}_time'] = time.time() - timer
+
+    print(f'{len(shapefile)} shapes, {n} bboxes of {size}m')
+    print(f'legacy quadrants: build {legacy_build:.2f}s, query {legacy_query:.2f}s ({n / legacy_query:.1f} bboxes/s)')
+    for exact, name in ((False, 'STRtree bbox'), (True, 'STRtree exact')):
+        query = results[f'{exact}_time']
+        print(f'{name}: build {build:.2f}s, query {query:.2f}s ({n / query:.1f} bboxes/s), '
+              f'usable {sum(results[exact])} (legacy {sum(legacy)}), '
+              f'missed by legacy {sum(r and not l for r, l in zip(results[exact], legacy))}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--shapefile', type=str, help='district shapefile (zip) of the ALKIS land use, e.g. forwardpass/data/alkis/<lk>.zip')
+    parser.add_argument('--n', type=int, default=1000)
+    parser.add_argument('--size', type=float, default=102.4, help='bbox size in m (256px crops of DOP40)')
+    args = parser.parse_args()
+
+    benchmark(args.shapefile, args.n, args.size)
\ No newline at end of file
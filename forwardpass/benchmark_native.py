@@ -0,0 +1,73 @@
+import sys
+import os
+
+#adding path to the some modules
+for modules in ['.', 'preprocessing']:
+    path = os.path.abspath(modules)
+    sys.path.append(path)
+
+import argparse
+import time
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+from split_return import Split, loadMask, maskPath
+from predict import Predictor
+
+def predict_tiles(predictor, tiles_path, split_size, tile_size_px):
+    """
+    Predicts all tiles split into crops of split_size and merges the crops (union over overlaps) into one binary mask per tile.
+    Returns the masks and the time the prediction took.
+    """
+    split = Split(tile_size_px, split_size)
+    images = ((Image.fromarray(array), image_name, q) for array, image_name, q, _ in split.iterImages(tiles_path))
+    masks = {}
+    timer = time.time()
+    for (image, image_name, q), pred in tqdm(predictor.predict_stream(images, split_size),
+                                             total=len(os.listdir(tiles_path)) * len(split.split_coos_),
+                                             desc=f'Predicting {split_size}px crops'):
+        if image_name not in masks:
+            masks[image_name] = np.zeros((tile_size_px, tile_size_px), dtype=bool)
+        coos = split.split_coos_[q]
+        masks[image_name][coos[1]:coos[3], coos[0]:coos[2]] |= pred > 0.5
+    return masks, time.time() - timer
+
+def iou(mask_1, mask_2):
+    union = np.logical_or(mask_1, mask_2).sum()
+    return np.logical_and(mask_1, mask_2).sum() / union if union else 1.0
+
+def compare(config, model, tiles_path, split_size, masks_path, tile_size_px, tile_size_m, batch_size):
+    """
+    Compares the native mode (crops of the model input size) to the upscaled crops of split_size
+    in throughput, agreement and, if ground truth masks (<tile>.npy or <tile>.packed.npy) are given, IoU.
+    """
+    predictor = Predictor(config, model, batch_size=batch_size)
+    results = {}
+    for name, size in (('upscaled', split_size), ('native', predictor.inp_size)):
+        masks, seconds = predict_tiles(predictor, tiles_path, size, tile_size_px)
+        results[name] = masks
+        km2 = len(masks) * (tile_size_m / 1000) ** 2
+        print(f'{name} ({size}px crops): {seconds:.1f}s, {km2 / seconds:.4f}km^2/s')
+        if masks_path is not None:
+            ious = [iou(masks[tile], loadMask(maskPath(masks_path, tile)) > 0) for tile in masks]
+            print(f'{name}: mean IoU to ground truth {np.mean(ious):.4f}')
+
+    px_area = (tile_size_m / tile_size_px) ** 2
+    for tile in results['upscaled']:
+        upscaled = results['upscaled'][tile]
+        native = results['native'][tile]
+        print(f'{tile}: IoU native/upscaled {iou(upscaled, native):.4f}, '
+              f'area upscaled {upscaled.sum() * px_area:.1f}m^2, native {native.sum() * px_area:.1f}m^2')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--config', type=str, default='configs/ma_B_cuda.yaml')
+    parser.add_argument('--model', type=str)
+    parser.add_argument('--tiles', type=str, help='folder of the (downloaded) GeoTIFF tiles')
+    parser.add_argument('--split_size', type=int, default=256)
+    parser.add_argument('--masks', type=str, default=None, help='optional folder of ground truth masks <tile>.npy or <tile>.packed.npy (preprocessing)')
+    parser.add_argument('--batch-size', type=int, default=None)
+    args = parser.parse_args()
+
+    compare(args.config, args.model, args.tiles, args.split_size, args.masks, 2500, 1000, args.batch_size)
@@ -1,20 +1,31 @@
 import os
 import rasterio
 import numpy as np
+from rasterio.transform import from_origin
+from rasterio.windows import from_bounds
+
+def tile_name(mask_filename):
+    return f'{mask_filename.split("_")[0]}_{mask_filename.split("_")[1]}'
+
+def group_split_tiles(masks_path):
+    # one directory scan: {tile: [split tile filenames]}
+    tile_dict = {}
+    with os.scandir(masks_path) as entries:
+        for entry in entries:
+            if entry.is_file():
+                tile_dict.setdefault(tile_name(entry.name), []).append(entry.name)
+    return tile_dict
 
 def get_tiles(masks_path):
-    tile_list = []
-    for mask_filename in os.listdir(masks_path):
-        if f'{mask_filename.split("_")[0]}_{mask_filename.split("_")[1]}' not in tile_list:
-            tile_list.append(f'{mask_filename.split("_")[0]}_{mask_filename.split("_")[1]}')
-    return tile_list
+    return list(group_split_tiles(masks_path))
 
 def get_split_tiles(masks_path, tile):
-    split_tile_list = []
-    for mask_filename in os.listdir(masks_path):
-        if f'{mask_filename.split("_")[0]}_{mask_filename.split("_")[1]}' == tile:
-            split_tile_list.append(mask_filename)
-    return split_tile_list
+    return group_split_tiles(masks_path).get(tile, [])
+
+def get_tile_bounds(mask_filename, filepath):
+    # only reads the header, not the data
+    with rasterio.open(f"{filepath}/{mask_filename}") as tif:
+        return tif.bounds #xmin=0,ymin=1,xmax=2,ymax=3 (utm32)
 
 def get_tile_data(mask_filename, filepath):
     with rasterio.open(f"{filepath}/{mask_filename}") as tif:
@@ -22,59 +33,87 @@ def get_tile_data(mask_filename, filepath):
         array = tif.read(1)
     return tiff_coos, array
 
-def read_split_tiles(maskpath, tile):
-    split_tile_list = get_split_tiles(maskpath, tile)
+def read_split_tiles(maskpath, tile, split_tile_list=None):
+    if split_tile_list is None:
+        split_tile_list = get_split_tiles(maskpath, tile)
     split_tile_dict = {}
     for split_tile in split_tile_list:
         split_tile_dict[split_tile] = (get_tile_data(split_tile, maskpath))
     return split_tile_dict
 
 def get_min_coords(split_tile_dict):
-    min_coords_x = []
-    min_coords_y = []
-    for key in split_tile_dict:
-        min_coords_x.append(split_tile_dict[key][0][0])
-        min_coords_y.append(split_tile_dict[key][0][1])
-    return (min(min_coords_x), min(min_coords_y))
+    return min_coords_of([split_tile_dict[key][0] for key in split_tile_dict])
+
+def min_coords_of(bounds_list):
+    return (min(bounds[0] for bounds in bounds_list), min(bounds[1] for bounds in bounds_list))
+
+def get_window(bounds, min_coords, tile_size_px, tile_size_m):
+    # canvas: tile_size_m x tile_size_m from min_coords (bottom left), rows run from north to south
+    transform = from_origin(min_coords[0], min_coords[1] + tile_size_m, tile_size_m/tile_size_px, tile_size_m/tile_size_px)
+    return from_bounds(*bounds, transform=transform).round_offsets().round_lengths()
+
+def add_to_full_array(full_array, window, array):
+    # toranges keeps negative offsets (toslices clamps them to 0 and loses the shift)
+    (row_start, row_stop), (col_start, col_stop) = window.toranges()
+    part = full_array[max(row_start, 0):max(row_stop, 0), max(col_start, 0):max(col_stop, 0)]
+    # the part of array outside of the canvas (negative offsets) is cropped, not shifted
+    array = array[max(-row_start, 0):, max(-col_start, 0):]
+    # union with the already placed (overlapping) split tiles
+    np.maximum(part, array[:part.shape[0], :part.shape[1]] == 1, out=part)
 
 def create_full_array(split_tile_dict, min_coords, tile_size_px, tile_size_m):
-    utm2px = tile_size_px/tile_size_m
-    full_array = np.zeros((tile_size_px, tile_size_px))
+    full_array = np.zeros((tile_size_px, tile_size_px), dtype=np.uint8)
     for key in split_tile_dict:
-        x_min_utm = split_tile_dict[key][0][0] - min_coords[0]
-        y_min_utm = split_tile_dict[key][0][1] - min_coords[1]
-        x_min = int(x_min_utm*utm2px)
-        y_min = int(y_min_utm*utm2px)
-        for y in range(split_tile_dict[key][1].shape[0]):
-            for x in range(split_tile_dict[key][1].shape[1]):
-                if split_tile_dict[key][1][x,y] == 1:
-                    full_array[x_min+x,y_min+y] = 1
+        bounds, array = split_tile_dict[key]
+        add_to_full_array(full_array, get_window(bounds, min_coords, tile_size_px, tile_size_m), array)
+    return full_array
+
+def create_full_array_files(masks_path, split_tile_list, tile_size_px, tile_size_m):
+    # reads the bounds first and then every mask straight into the canvas, only one array is in memory at a time
+    bounds_dict = {split_tile: get_tile_bounds(split_tile, masks_path) for split_tile in split_tile_list}
+    min_coords = min_coords_of(list(bounds_dict.values()))
+    full_array = np.zeros((tile_size_px, tile_size_px), dtype=np.uint8)
+    for split_tile, bounds in bounds_dict.items():
+        with rasterio.open(f"{masks_path}/{split_tile}") as tif:
+            array = tif.read(1)
+        add_to_full_array(full_array, get_window(bounds, min_coords, tile_size_px, tile_size_m), array)
     return full_array
 
 def calc_tile_area_px(full_array):
-    area = np.sum(full_array)
+    area = np.count_nonzero(full_array)
     return area
 
 def px_area_to_m2(area_px, tile_size_px, tile_size_m):
     return (area_px / (tile_size_px**2)) * tile_size_m**2
 
-def calc_area(masks_path, tile, tile_size_px, tile_size_m):
-    split_tile_dict = read_split_tiles(masks_path, tile)
+def calc_area(masks_path, tile, tile_size_px, tile_size_m, split_tile_list=None):
+    if split_tile_list is None:
+        split_tile_list = get_split_tiles(masks_path, tile)
+    full_array = create_full_array_files(masks_path, split_tile_list, tile_size_px, tile_size_m)
+    return px_area_to_m2(calc_tile_area_px(full_array), tile_size_px, tile_size_m)
+
+def calc_area_dict(split_tile_dict, tile_size_px, tile_size_m):
+    # split_tile_dict: {split_tile: (bounds, binary array)} of one tile, e.g. straight from the forwardpass
     min_coords = get_min_coords(split_tile_dict)
     full_array = create_full_array(split_tile_dict, min_coords, tile_size_px, tile_size_m)
     area_px = calc_tile_area_px(full_array)
     area = px_area_to_m2(area_px, tile_size_px, tile_size_m)
     return area
 
-def calc_whole_area(masks_path, tile_size_px, tile_size_m):
-    tile_list = get_tiles(masks_path)
+def calc_whole_area(masks_path, tile_size_px, tile_size_m, tile_dict=None):
+    if tile_dict is None:
+        tile_dict = group_split_tiles(masks_path)
     area = 0
-    for tile in tile_list:
-        area += calc_area(masks_path, tile, tile_size_px, tile_size_m)
+    for tile, split_tile_list in tile_dict.items():
+        area += calc_area(masks_path, tile, tile_size_px, tile_size_m, split_tile_list)
     return area
 
 def main(masks_path, tile_size_px, tile_size_m):
-    area = calc_whole_area(masks_path, tile_size_px, tile_size_m)
+    tile_dict = group_split_tiles(masks_path)
+    area = calc_whole_area(masks_path, tile_size_px, tile_size_m, tile_dict)
+    print_area(area, len(tile_dict), tile_size_m)
+
+def print_area(area, n_tiles, tile_size_m):
     print(f'{area}m^2 of the tiles is covered by PV.')
-    print(f'{area/((tile_size_m**2)*len(get_tiles(masks_path)))}% of the tiles is covered by PV.')
+    print(f'{area/((tile_size_m**2)*n_tiles)}% of the tiles is covered by PV.')
     print(f'Calculated with 0.2kW/m^2 peak this would be {area*0.2}kW of peak power.')
\ No newline at end of file
@@ -1,10 +1,17 @@
 import os
-import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from tqdm import tqdm
 from pyproj import Transformer
+from fetch import Fetcher
 
 
 class DownloadOpenData:
+    def __init__(self, base_url: str = 'https://download1.bayernwolke.de/a/dop40/data', workers: int = 8, fetcher: Fetcher = None):
+        """ base_url: where the tiles are served from (e.g. a local stand-in), workers: parallel downloads. """
+        self.base_url = base_url.rstrip('/')
+        self.workers = workers
+        self.fetcher = fetcher or Fetcher(pool_size=workers)
+
     def utm_to_download(self, x: str, y: str):
         """ Converts UTM coordinates to download-link for open data."""
 
@@ -13,7 +20,7 @@ class DownloadOpenData:
         x_tile = x[:-3]
         y_tile = y[:-3]
 
-        return f'https://download1.bayernwolke.de/a/dop40/data/{zone}{x_tile}_{y_tile}.tif'
+        return f'{self.base_url}/{zone}{x_tile}_{y_tile}.tif'
 
 
     def download_open_data(self, x: str, y: str, out_dir: str):
@@ -24,12 +31,11 @@ class DownloadOpenData:
 
         out_file = os.path.join(out_dir, filename)
 
-        if not os.path.isdir(out_dir):
-            os.makedirs(out_dir)        
+        os.makedirs(out_dir, exist_ok=True)
 
+        # out_file only appears after a complete download, a broken one is resumed from out_file.part
         if not os.path.exists(out_file):
-            r = requests.get(url, allow_redirects=True)
-            open(out_file, 'wb').write(r.content)
+            self.fetcher.fetch(url, out_file)
         else:
             print(f'File {out_file} already exists, skipping download.')
 
@@ -47,9 +53,18 @@ class DownloadOpenData:
         return tiles
 
     def download_list_of_tiles(self, tiles: list, out_dir: str):
-        """ Downloads a list of tiles. """
-        for tile in tqdm(tiles, desc='Downloading tiles'):
-            self.download_open_data(tile[0], tile[1], out_dir)
+        """ Downloads a list of tiles, workers at a time. """
+        failed = []
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {executor.submit(self.download_open_data, tile[0], tile[1], out_dir): tile for tile in tiles}
+            for future in tqdm(as_completed(futures), total=len(futures), desc='Downloading tiles'):
+                try:
+                    future.result()
+                except Exception as e:
+                    print(f'Download of tile {futures[future]} failed: {e}')
+                    failed.append(futures[future])
+        if failed:
+            raise RuntimeError(f'{len(failed)} of {len(tiles)} tiles could not be downloaded: {failed}')
     
     def check_utm_coos(self, x1: str, y1: str, x2: str, y2: str):
         """ checks if coordinates are in bavaria and if they are in the right order """
@@ -0,0 +1,113 @@
+import os
+import time
+import hashlib
+import requests
+from requests.adapters import HTTPAdapter
+
+
+class _Progress:
+    """ Forwards the bytes written by one fetch to progress and keeps the count in line with the bytes in the .part file. """
+
+    def __init__(self, progress=None):
+        self.progress = progress
+        self.counted = 0
+
+    def __call__(self, n: int):
+        self.counted += n
+        if self.progress is not None and n:
+            self.progress(n)
+
+    def reset(self, size: int):
+        # the .part file holds size valid bytes now: bytes of a removed or restarted file are taken back, kept bytes counted once
+        self(size - self.counted)
+
+
+class Fetcher:
+    """
+    Downloads files over one shared, pooled session. The body is streamed into <file>.part,
+    resumed by HTTP Range requests after interruptions, verified (size, optional sha256) and
+    only then atomically renamed to <file>, so an existing <file> is always complete.
+    """
+
+    def __init__(self, pool_size: int = 8, retries: int = 5, backoff: float = 1.0,
+                 chunk_size: int = 1024 * 1024, timeout: float = 60):
+        self.retries = retries
+        self.backoff = backoff
+        self.chunk_size = chunk_size
+        self.timeout = timeout
+        self.session = requests.Session()
+        # no retries in urllib3: connection errors, 429/5xx answers and broken bodies are all retried (and resumed) by fetch
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def fetch(self, url: str, out_file: str, size: int = None, sha256: str = None, progress=None, on_total=None):
+        """
+        Downloads url to out_file, resuming an existing out_file.part.
+        size, sha256: optional expected size in bytes and hex digest, the size is checked against the server's anyway.
+        progress: optional callable getting the number of bytes written (and already present in out_file.part),
+                  negative if bytes counted before are discarded (a server ignoring the range, a removed corrupt out_file.part).
+        on_total: optional callable getting the total size of the file, as soon as a GET answer announces it.
+        """
+        part_file = f'{out_file}.part'
+        progress = _Progress(progress)
+        for attempt in range(self.retries + 1):
+            try:
+                total = self._fetch_part(url, part_file, progress, on_total)
+                self._verify(part_file, size or total, sha256)
+                os.replace(part_file, out_file)
+                return out_file
+            except (requests.RequestException, IOError) as e:
+                client_error = (isinstance(e, requests.HTTPError) and e.response is not None
+                                and e.response.status_code < 500 and e.response.status_code != 429)
+                if client_error or attempt == self.retries:
+                    raise
+                print(f'Download of {url} failed ({e}), retrying.')
+                time.sleep(self.backoff * 2 ** attempt)
+
+    def _fetch_part(self, url: str, part_file: str, progress: _Progress, on_total=None):
+        """ Appends the missing bytes of url to part_file and returns the total size (None if unknown). """
+        offset = os.path.getsize(part_file) if os.path.exists(part_file) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        with self.session.get(url, headers=headers, stream=True, timeout=self.timeout, allow_redirects=True) as r:
+            if r.status_code == 416:
+                # nothing left to request, part_file is complete (or broken, which _verify will tell)
+                progress.reset(offset)
+                return self._content_range_total(r) or offset
+            r.raise_for_status()
+            if r.status_code != 206:
+                # the server ignored the range, start over
+                offset = 0
+            progress.reset(offset)
+            total = self._content_range_total(r)
+            if total is None and 'content-length' in r.headers:
+                total = offset + int(r.headers['content-length'])
+            if on_total is not None and total is not None:
+                on_total(total)
+            with open(part_file, 'ab' if offset else 'wb') as file:
+                for data in r.iter_content(chunk_size=self.chunk_size):
+                    file.write(data)
+                    progress(len(data))
+        return total
+
+    @staticmethod
+    def _content_range_total(r):
+        content_range = r.headers.get('content-range', '')
+        total = content_range.rsplit('/', 1)[-1]
+        return int(total) if total.isdigit() else None
+
+    def _verify(self, part_file: str, size: int = None, sha256: str = None):
+        """ Raises an IOError if part_file is incomplete or corrupt, a corrupt file is removed to start over. """
+        actual = os.path.getsize(part_file)
+        if size is not None and actual != size:
+            if actual > size:
+                os.remove(part_file)
+            raise IOError(f'{part_file} has {actual} of {size} bytes')
+        if sha256 is not None:
+            digest = hashlib.sha256()
+            with open(part_file, 'rb') as file:
+                for data in iter(lambda: file.read(self.chunk_size), b''):
+                    digest.update(data)
+            if digest.hexdigest() != sha256.lower():
+                os.remove(part_file)
+                raise IOError(f'{part_file} has a wrong sha256 checksum')
\ No newline at end of file
@@ -1,8 +1,12 @@
 import shapefile as shp
 import os
-import requests
+import numpy as np
+import shapely
+from shapely.geometry import shape, box
+from shapely.strtree import STRtree
 from tqdm import tqdm
 import json
+from fetch import Fetcher
 
 # List of land use types that are considered usable (all of kind "Siedlung")
 use_list = ['Wohnbaufläche','Industrie- und Gewerbefläche','Halde','Bergbaubetrieb',
@@ -11,109 +15,65 @@ use_list = ['Wohnbaufläche','Industrie- und Gewerbefläche','Halde','Bergbaubet
 
 
 
-def load_shapefile(foldername):
+def load_shapefile(foldername, shapefile_dir='forwardpass/data/alkis'):
     """
-    Loads the shapefile and returns a GeoDataFrame.
+    Loads the shapefile and returns a shapefile reader.
     """
-    return shp.Reader(f"forwardpass/data/alkis/{foldername}.zip")
+    return shp.Reader(f"{shapefile_dir}/{foldername}.zip")
 
 
-def find_usetype_point(shapefile, x,y):
+def find_usetype_point(search_tree, x, y):
     """
     Returns the type of use of the shape object that contains the point (x,y).
     """
-    for shape in shapefile.shapeRecords():
-        if shape.shape.bbox[0] <= x <= shape.shape.bbox[2] and shape.shape.bbox[1] <= y <= shape.shape.bbox[3]:
-            return shape.record.nutzart
-        
-    raise Exception(f"Point ({x},{y}) not in shapefile.")
+    tree, use_types = search_tree
+    matches = tree.query(shapely.Point(x, y), predicate='intersects')
+    if len(matches) == 0:
+        raise Exception(f"Point ({x},{y}) not in shapefile.")
+    return use_types[matches[0]]
 
 def Overlaps(bbox1, bbox2):
     """
-    Returns True if bbox1 and bbox2 overlap.
+    Returns True if bbox1 and bbox2 (xmin, ymin, xmax, ymax) overlap, including containment and touching.
     """
-    if (bbox1[0] <= bbox2[0] <= bbox1[2] and bbox1[1] <= bbox2[1] <= bbox1[3])\
-        or (bbox1[0] <= bbox2[2] <= bbox1[2] and bbox1[1] <= bbox2[3] <= bbox1[3])\
-            or (bbox1[0] <= bbox2[0] <= bbox1[2] and bbox1[1] <= bbox2[3] <= bbox1[3])\
-                or (bbox1[0] <= bbox2[2] <= bbox1[2] and bbox1[1] <= bbox2[1] <= bbox1[3]):
-        return True
-    else:
-        return False
+    return bbox1[0] <= bbox2[2] and bbox2[0] <= bbox1[2] and bbox1[1] <= bbox2[3] and bbox2[1] <= bbox1[3]
+
+def bbox_of(geo_info):
+    """
+    Returns the bbox (xmin, ymin, xmax, ymax) of a geo_info (x_min, y_max, x_max, y_min, ...).
+    """
+    return (min(geo_info[0], geo_info[2]), min(geo_info[1], geo_info[3]),
+            max(geo_info[0], geo_info[2]), max(geo_info[1], geo_info[3]))
     
 def create_search_tree(shapefile):
     """
-    Creates a search tree for the shapefile.
-    """
-    splits = 4
-    tree = {}
-    threshold_x = (shapefile.bbox [2] - shapefile.bbox [0]) / (splits/2) + shapefile.bbox [0]
-    threshold_y = (shapefile.bbox [3] - shapefile.bbox [1]) / (splits/2) + shapefile.bbox [1]
-
-    #create tree
-    tree[shapefile.bbox[0],shapefile.bbox[1],threshold_x,threshold_y] = {}
-    tree[shapefile.bbox[0],threshold_y,threshold_x,shapefile.bbox[3]] = {}
-    tree[threshold_x,shapefile.bbox[1],shapefile.bbox[2],threshold_y] = {}
-    tree[threshold_x,threshold_y,shapefile.bbox[2],shapefile.bbox[3]] = {}
-
-    #add shapes to tree
-    for shape in tqdm(shapefile.shapeRecords(), desc='Creating search tree'):
-        #bottom left
-        if shape.shape.bbox[0] <= threshold_x:
-            if shape.shape.bbox[1] <= threshold_y:
-                #q3
-                tree[shapefile.bbox[0],shapefile.bbox[1],threshold_x,threshold_y].update({tuple(shape.shape.bbox):shape.record.nutzart})
-            else:
-                #q2
-                tree[shapefile.bbox[0],threshold_y,threshold_x,shapefile.bbox[3]].update({tuple(shape.shape.bbox):shape.record.nutzart})
-        else:
-            if shape.shape.bbox[1] <= threshold_y:
-                #q4
-                tree[threshold_x,shapefile.bbox[1],shapefile.bbox[2],threshold_y].update({tuple(shape.shape.bbox):shape.record.nutzart})
-            else:
-                #q1
-                tree[threshold_x,threshold_y,shapefile.bbox[2],shapefile.bbox[3]].update({tuple(shape.shape.bbox):shape.record.nutzart})
-        #top right
-        if shape.shape.bbox[2] <= threshold_x:
-            if shape.shape.bbox[3] <= threshold_y:
-                #only in q3
-                pass
-            else:
-                #q2
-                tree[shapefile.bbox[0],threshold_y,threshold_x,shapefile.bbox[3]].update({tuple(shape.shape.bbox):shape.record.nutzart})
-        else:
-            if shape.shape.bbox[3] <= threshold_y:
-                #q4
-                tree[threshold_x,shapefile.bbox[1],shapefile.bbox[2],threshold_y].update({tuple(shape.shape.bbox):shape.record.nutzart})
-            else:
-                #q1
-                tree[threshold_x,threshold_y,shapefile.bbox[2],shapefile.bbox[3]].update({tuple(shape.shape.bbox):shape.record.nutzart})
-    return tree
-        
-
+    Creates a search tree (STRtree over the shapes, use type per shape) for the shapefile.
+    """
+    geoms = [shape(s) for s in tqdm(shapefile.iterShapes(), total=len(shapefile), desc='Creating search tree')]
+    use_types = np.array([record.nutzart for record in shapefile.iterRecords(fields=['nutzart'])], dtype=object)
+    return STRtree(geoms), use_types
 
+def find_usetypes_inside_bb(bbox, search_tree, exact=True):
+    """
+    Returns the types of use of all shape objects intersecting the bbox (exact: their geometry, else: their bbox).
+    """
+    tree, use_types = search_tree
+    matches = tree.query(box(*bbox), predicate='intersects' if exact else None)
+    return use_types[matches]
 
-def find_usetype_inside_bb(bbox, use_list, search_tree):
+def find_usetype_inside_bb(bbox, use_list, search_tree, exact=True):
     """
-    Returns the type of use of the shape object that contains the point (x,y).
+    Returns True if a shape object of a type of use in use_list intersects the bbox.
     """
-    use = False
-    found = False
-    for key in tree.keys():
-        if Overlaps(key, bbox):
-            found = True
-            for key2 in tree[key].keys():
-                if Overlaps(key2, bbox):
-                    found = True
-                    if check_if_usable(tree[key][key2], use_list):
-                        use = True
-    if found == False:
+    use_types = find_usetypes_inside_bb(bbox, search_tree, exact)
+    if len(use_types) == 0:
         raise Exception(f"Bbox ({bbox[0]},{bbox[1]}) not in shapefile.")
-    return use
+    return any(check_if_usable(use_type, use_list) for use_type in use_types)
         
 
 def check_if_usable(usetype, use_list):
     """
-    Returns True if the type of use of the shape object that contains the point (x,y) is in use_list.
+    Returns True if the type of use is in use_list.
     """
     if usetype in use_list:
         return True
@@ -121,12 +81,21 @@ def check_if_usable(usetype, use_list):
         return False
 
 
-def get_alkis_url(bbox,read_dir):
+def load_lk_list(read_dir):
     """
-    Returns the url of the alkis shapefile.
+    Returns the list of all shapefiles + boundingboxes (lk_list.json).
     """
     with open(f'{read_dir}/lk_list.json', 'r') as fp:
-        lk_list = json.load(fp)
+        return json.load(fp)
+
+
+def get_alkis_url(bbox,read_dir,lk_list=None):
+    """
+    Returns the url of the alkis shapefile.
+    lk_list: already loaded lk_list.json, read from read_dir if None
+    """
+    if lk_list is None:
+        lk_list = load_lk_list(read_dir)
 
     dl_list = []
     for key, value in lk_list.items():
@@ -135,18 +104,17 @@ def get_alkis_url(bbox,read_dir):
     return dl_list
 
 
-def download_shapefile(dl_list, out_dir):
+def download_shapefile(dl_list, out_dir, fetcher=None):
     """
     Downloads the shapefile.
     """
+    fetcher = fetcher or Fetcher()
+    os.makedirs(out_dir, exist_ok=True)
     for url in tqdm(dl_list, desc='Downloading shapefile'):
         filename = url[1].split('/')[-1]
         out_file = os.path.join(out_dir, filename)
-        if not os.path.isdir(out_dir):
-            os.makedirs(out_dir)        
         if not os.path.exists(out_file):
-            r = requests.get(url[1], allow_redirects=True)
-            open(out_file, 'wb').write(r.content)
+            fetcher.fetch(url[1], out_file)
         else:
             print(f'File {out_file} already exists, skipping download.')
 
@@ -157,36 +125,44 @@ def make_lk_list(shapefile_dir, out_dir):
     lk_list = {}
     for file in os.listdir(shapefile_dir):
         if file.endswith(".zip"):
-            shapefile = load_shapefile(file[:-4])
+            shapefile = load_shapefile(file[:-4], shapefile_dir)
             lk_list.update({file[:-4]:tuple(shapefile.bbox)})
     with open(f'{out_dir}/lk_list.json', 'w') as fp:
         json.dump(lk_list, fp)
 
-def check_geolist(split_coos_list):
+def check_geolist(split_coos_list, read_dir='forwardpass/data', shapefile_dir='forwardpass/data/alkis'):
     """
-        Checks which tiles are useful and which are not.
+        Checks which tiles are useful and which are not, returns the useful ones.
     """
-
-    #load shapefile
+    #download the shapefiles of all needed districts
+    lk_list = load_lk_list(read_dir)
     dl_list = set()
     for img in split_coos_list.values():
-        dl_list.add(get_alkis_url([img[0],img[1],img[2],img[3]],'forwardpass/data'))
-    #download shapefile
+        dl_list.update(get_alkis_url(bbox_of(img), read_dir, lk_list))
+    download_shapefile(sorted(dl_list), shapefile_dir)
+
+    #load shapefiles
+    search_trees = {lk: create_search_tree(load_shapefile(lk, shapefile_dir)) for lk, _ in dl_list}
+
+    needed_list = []
+    for f_name, img in tqdm(split_coos_list.items(), desc='Checking land usage'):
+        bbox = bbox_of(img)
+        for search_tree in search_trees.values():
+            if any(check_if_usable(use_type, use_list) for use_type in find_usetypes_inside_bb(bbox, search_tree)):
+                needed_list.append(f_name)
+                break
+    return needed_list
+
+
+if __name__ == '__main__':
+    #test
+    bbox = [597627, 5292841, 597704, 5293004]
+    dl_list = get_alkis_url(bbox,'forwardpass/data')
     download_shapefile(dl_list, "forwardpass/data/alkis")
+    for file in dl_list:
+        tree = create_search_tree(load_shapefile(file[0]))
+        print(find_usetype_inside_bb([597627, 5292841, 597704, 5293004], use_list, tree))
+        print(find_usetype_inside_bb([597304, 5292841, 597327, 5293004], use_list, tree))
 
-    
-    
-    
-
-#test
-bbox = [597627, 5292841, 597704, 5293004]
-dl_list = get_alkis_url(bbox,'forwardpass/data')
-download_shapefile(dl_list, "forwardpass/data/alkis")
-for file in dl_list:
-    shapefile = load_shapefile(file[0])
-    tree = create_search_tree(shapefile)
-    print(find_usetype_inside_bb([597627, 5292841, 597704, 5293004], use_list, tree))
-    print(find_usetype_inside_bb([597327, 5292841, 597304, 5293004], use_list, tree))
-
-#get list of all shapefiles
-make_lk_list("forwardpass/data/alkis", "forwardpass/data")
\ No newline at end of file
+    #get list of all shapefiles
+    make_lk_list("forwardpass/data/alkis", "forwardpass/data")
\ No newline at end of file
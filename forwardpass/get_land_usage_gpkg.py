@@ -1,159 +1,186 @@
 import fiona
+import numpy as np
+import shapely
 from shapely.geometry import shape, box
 from shapely.strtree import STRtree
-import pickle
 from tqdm import tqdm
 import os
-import requests
+import json
+import shutil
+from fetch import Fetcher
 
-def download_gpkg(out_dir):
+gpkg_path = 'forwardpass/data/alkis/Nutzung_kreis.gpkg'
+index_path = 'forwardpass/data/alkis/index'
+# bump if the layout of the index files changes, older indexes are rebuilt
+index_version = 1
+
+def download_gpkg(out_dir, url='https://geodaten.bayern.de/odd/m/3/daten/tn/Nutzung_kreis.gpkg', sha256=None):
     """
-    Downloads the shapefile.
+    Downloads the geopackage (about 5GB) in 8MiB chunks, resumable and only renamed to its final name once complete
+    (size announced by the server and optional sha256 checked).
     """
-    url = 'https://geodaten.bayern.de/odd/m/3/daten/tn/Nutzung_kreis.gpkg'
     filename = url.split('/')[-1]
     out_file = os.path.join(out_dir, filename)
-    if not os.path.isdir(out_dir):
-        os.makedirs(out_dir)        
+    os.makedirs(out_dir, exist_ok=True)
     if not os.path.exists(out_file):
         print(f'Downloading {filename} about 5GB')
-        r = requests.get(url, allow_redirects=True, stream=True)
-        total = int(r.headers.get('content-length', 0))
-        with open(out_file, 'wb') as file, tqdm(
-                desc=f'Downloading {filename}',
-                total=total,
-                unit='iB',
-                unit_scale=True,
-                unit_divisor=1024,
-        ) as bar:
-            for data in r.iter_content(chunk_size=1024):
-                size = file.write(data)
-                bar.update(size)
+        fetcher = Fetcher(pool_size=1, chunk_size=8 * 1024 * 1024)
+        with tqdm(desc=f'Downloading {filename}', unit='iB', unit_scale=True, unit_divisor=1024) as bar:
+            def set_total(total):
+                # announced by the (resumed) GET itself, no separate request
+                bar.total = total
+                bar.refresh()
+            fetcher.fetch(url, out_file, sha256=sha256, progress=bar.update, on_total=set_total)
     else:
         print(f'File {out_file} already exists, skipping download.')
 
-def buildLKTree():
+def getLkList():
     '''
-    Builds a spatial index for all layers (Landkreise) in the gpkg file and returns it
+    Returns the name and bounds of all layers (Landkreise) in the gpkg file
     '''
     lk = []
-    for layer in fiona.listlayers('forwardpass/data/alkis/Nutzung_kreis.gpkg'):
-        lk.append((layer,fiona.open('forwardpass/data/alkis/Nutzung_kreis.gpkg', layer=layer).bounds))
-    lk_tree = STRtree([box(*bounds) for layer, bounds in lk])
-    return lk_tree, lk
-    
+    for layer in fiona.listlayers(gpkg_path):
+        with fiona.open(gpkg_path, layer=layer) as src:
+            lk.append((layer, tuple(src.bounds)))
+    return lk
+
+def buildLKTree(lk):
+    '''
+    Builds a spatial index for all layers (Landkreise) and returns it
+    '''
+    return STRtree([box(*bounds) for layer, bounds in lk])
 
-def getInnerTree(lk):
+def getInnerGeoms(lk):
     '''
-    Builds a spatial index for all land use polygons in the layer lk and returns it (to search inside the Landkreis)
+    Reads all land use polygons and their use types of the layer lk from the gpkg file
     '''
     geoms = []
     use_types = []
-    with fiona.open('forwardpass/data/alkis/Nutzung_kreis.gpkg', layer=lk) as src:
+    with fiona.open(gpkg_path, layer=lk) as src:
         for feature in src:
             geoms.append(shape(feature['geometry']))
             use_types.append(feature['properties']['nutzart'])
+    return geoms, use_types
+
+def gpkgSignature():
+    return {'size': os.path.getsize(gpkg_path), 'mtime_ns': os.stat(gpkg_path).st_mtime_ns}
+
+def writeAtomic(path, write):
+    '''
+    Writes path with write(file) into a temporary file first, so an interrupted build leaves no half written index file
+    '''
+    with open(f'{path}.tmp', 'wb') as f:
+        write(f)
+    os.replace(f'{path}.tmp', path)
+
+def checkIndex():
+    '''
+    Returns the metadata of the land use index. An index of another version or of a changed gpkg is removed and rebuilt.
+    Index: meta.json (version, gpkg size/mtime, districts) and per district <lk>.wkb, <lk>.offsets.npy, <lk>.use.npy, <lk>.json
+    '''
+    meta_file = f'{index_path}/meta.json'
+    if os.path.exists(meta_file):
+        with open(meta_file, 'r') as f:
+            meta = json.load(f)
+        if meta['version'] == index_version and meta['gpkg'] == gpkgSignature():
+            return meta
+        print('Land use index is outdated, rebuilding it')
+        shutil.rmtree(index_path)
+    os.makedirs(index_path, exist_ok=True)
+    print('Building search tree for Districts (LK)')
+    meta = {'version': index_version, 'gpkg': gpkgSignature(), 'lk': getLkList()}
+    writeAtomic(meta_file, lambda f: f.write(json.dumps(meta).encode()))
+    return meta
 
-    #create spatial index for geoms
-    tree = STRtree(geoms)
-    return tree, use_types
-    
-def findLks(bbox, lk_tree, lk):
+def buildInnerIndex(lk):
     '''
-    Returns all layers (LK) that intersect the bbox
+    Writes the land use polygons of the layer lk as concatenated WKB (+ offsets) and their use types as codes into the index
     '''
-    lk_matches = lk_tree.query(bbox)
-    
-    lks = []
-    for match in lk_matches:
-        lks.append(lk[match][0])
-    return lks
+    geoms, use_types = getInnerGeoms(lk)
+    wkb = shapely.to_wkb(np.array(geoms, dtype=object))
+    offsets = np.zeros(len(wkb) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(geom) for geom in wkb])
+    use_table, codes = np.unique(np.array(use_types, dtype=str), return_inverse=True)
+    writeAtomic(f'{index_path}/{lk}.wkb', lambda f: f.write(b''.join(wkb)))
+    writeAtomic(f'{index_path}/{lk}.offsets.npy', lambda f: np.save(f, offsets))
+    writeAtomic(f'{index_path}/{lk}.use.npy', lambda f: np.save(f, codes.astype(np.int16)))
+    # written last, marks the layer as complete
+    writeAtomic(f'{index_path}/{lk}.json', lambda f: f.write(json.dumps({'use_types': use_table.tolist()}).encode()))
 
 def loadInnerTree(lk):
     '''
-    Loads the inner tree and use_types for the layer lk from the pickle files or creates them if they don't exist
+    Loads the usable land use polygons of the layer lk from the (memory mapped) index, building it first if it doesn't exist.
+    Returns a tree of only these polygons and their use_types, the tree is built on load (shapely trees can't be stored safely).
     '''
-    try:
-        with open(f'forwardpass/data/alkis/tree_{lk}.pkl', 'rb') as f:
-            inner_tree = pickle.load(f)
-        with open(f'forwardpass/data/alkis/use_{lk}.pkl', 'rb') as f:
-            use_types = pickle.load(f)
-    except:
+    if not os.path.exists(f'{index_path}/{lk}.json'):
         print(f'Building search tree for {lk}')
-        inner_tree, use_types = getInnerTree(lk)
-        with open(f'forwardpass/data/alkis/tree_{lk}.pkl', 'wb') as f:
-            pickle.dump(inner_tree, f)
-        with open(f'forwardpass/data/alkis/use_{lk}.pkl', 'wb') as f:
-            pickle.dump(use_types, f)
-    return inner_tree, use_types
-
-def getLandUse(bbox, inner_tree, use_types):
-    '''
-    Returns True if the bbox intersects with a land use polygon of the specified type
-    '''
-    # List of land use types that are considered usable (all of kind "Siedlung")
-    use_list = ['Wohnbaufläche','Industrie- und Gewerbefläche',
-                'Fläche gemischter Nutzung','Fläche besonderer funktionaler Prägung',
-                'Sport-, Freizeit- und Erholungsfläche']
-    
-    matches = inner_tree.query(bbox)
-    for match in matches:
-        if use_types[match] in use_list:
-            return True
-    return False
+        buildInnerIndex(lk)
+    with open(f'{index_path}/{lk}.json', 'r') as f:
+        use_table = np.array(json.load(f)['use_types'], dtype=object)
+    codes = np.load(f'{index_path}/{lk}.use.npy', mmap_mode='r')
+    offsets = np.load(f'{index_path}/{lk}.offsets.npy', mmap_mode='r')
+    idx = np.flatnonzero(getUsable(use_table)[codes]) if len(use_table) else np.zeros(0, dtype=int)
+    geoms = []
+    if len(idx):
+        wkb = np.memmap(f'{index_path}/{lk}.wkb', dtype=np.uint8, mode='r')
+        geoms = shapely.from_wkb([wkb[offsets[i]:offsets[i + 1]].tobytes() for i in idx])
+    return STRtree(geoms), use_table[codes[idx]]
+
+# List of land use types that are considered usable (all of kind "Siedlung")
+use_list = ['Wohnbaufläche','Industrie- und Gewerbefläche',
+            'Fläche gemischter Nutzung','Fläche besonderer funktionaler Prägung',
+            'Sport-, Freizeit- und Erholungsfläche']
+
+def getUsable(use_types):
+    '''
+    Returns a boolean array, True for every land use polygon of a usable type
+    '''
+    return np.isin(np.asarray(use_types, dtype=object), use_list)
+
+def getBoxes(geo_list):
+    '''
+    Returns the names and the boxes of all geo_infos (x_min, y_max, x_max, y_min, ...) as one shapely geometry array
+    '''
+    names = list(geo_list)
+    coos = np.array([geo_list[f_name][0:4] for f_name in names], dtype=float).reshape(-1, 4)
+    boxes = shapely.box(coos[:, 0], np.minimum(coos[:, 1], coos[:, 3]), coos[:, 2], np.maximum(coos[:, 1], coos[:, 3]))
+    return names, boxes
+
+def checkBoxes(boxes, lk_tree, lk):
+    '''
+    Returns the keep mask of all boxes: True if a box intersects a usable land use polygon.
+    One bulk query for the districts and one per district for its land use, only one district tree is loaded at a time.
+    '''
+    keep = np.zeros(len(boxes), dtype=bool)
+    box_idx, lk_idx = lk_tree.query(boxes, predicate='intersects')
+    for lk_i in tqdm(np.unique(lk_idx), desc='Checking land usage'):
+        candidates = box_idx[lk_idx == lk_i]
+        # boxes already kept by another district need no further check
+        candidates = candidates[~keep[candidates]]
+        if len(candidates) == 0:
+            continue
+        # the tree only holds usable polygons, every hit keeps its box
+        inner_tree, _ = loadInnerTree(lk[lk_i][0])
+        match_idx = inner_tree.query(boxes[candidates], predicate='intersects')[0]
+        keep[candidates[match_idx]] = True
+    return keep
 
 def getLkTree():
     '''
-    Loads the lk_tree and lk from the pickle files or creates them if they don't exist
+    Loads the lk_tree and lk from the index or creates them if they don't exist
     '''
-    try:
-        with open('forwardpass/data/alkis/lk_tree.pkl', 'rb') as f:
-            lk_tree = pickle.load(f)
-        with open('forwardpass/data/alkis/lk.pkl', 'rb') as f:
-            lk = pickle.load(f)
-    except:
-        print('Building search tree for Districts (LK)')
-        lk_tree, lk = buildLKTree()
-        with open('forwardpass/data/alkis/lk_tree.pkl', 'wb') as f:
-            pickle.dump(lk_tree, f)
-        with open('forwardpass/data/alkis/lk.pkl', 'wb') as f:
-            pickle.dump(lk, f)
-    return lk_tree, lk
+    lk = [(layer, tuple(bounds)) for layer, bounds in checkIndex()['lk']]
+    return buildLKTree(lk), lk
 
-def checkGeoList(geo_list, img_path):
+def checkGeoList(geo_list, img_path=None):
     '''
-    Checks the land usage for all images in the geo_list and deletes the ones that are not needed
+    Checks the land usage for all images in the geo_list, deletes the ones that are not needed (if img_path is given) and returns the needed ones
     '''
     download_gpkg('forwardpass/data/alkis')
     lk_tree, lk_bb = getLkTree()
-    inner_tree = {}
-    use_types = {}
-    t_use = 0
-    for f_name, bbox in tqdm(geo_list.items(), desc='Checking land usage'):
-        lks = findLks(box(*bbox[0:4]), lk_tree, lk_bb)
-        needed = None
-        if set(inner_tree.keys()).issuperset(set(lks)):
-            for lk in lks:
-                use_types[lk] = (t_use, use_types[lk][1])
-                t_use += 1
-                needed = getLandUse(box(*bbox[0:4]), inner_tree[lk], use_types[lk][1])
-                if needed:
-                    break
-            if not needed:
-                os.remove(f'{img_path}/{f_name}.png')
-        else:
-            for lk in lks:
-                new_inner_tree, new_use_types = loadInnerTree(lk)
-                inner_tree[lk] = new_inner_tree
-                use_types[lk] = (t_use, new_use_types)
-                t_use += 1
-                needed = getLandUse(box(*bbox[0:4]), inner_tree[lk], use_types[lk][1])
-                if len(use_types) > 4:
-                    min_key = min(use_types, key=lambda k: use_types[k][0])
-                    del inner_tree[min_key]
-                    del use_types[min_key]
-                if needed:
-                    break
-            if not needed:
-                os.remove(f'{img_path}/{f_name}.png')
-        
\ No newline at end of file
+    names, boxes = getBoxes(geo_list)
+    keep = checkBoxes(boxes, lk_tree, lk_bb)
+    if img_path is not None:
+        for f_name in np.array(names, dtype=object)[~keep]:
+            os.remove(f'{img_path}/{f_name}.png')
+    return [f_name for f_name, needed in zip(names, keep) if needed]
@@ -0,0 +1,159 @@
+import sys
+import os
+
+#adding path to the some modules
+for modules in ['.', 'preprocessing']:
+    path = os.path.abspath(modules)
+    sys.path.append(path)
+
+import argparse
+import numpy as np
+from rasterio import features
+from rasterio.transform import from_origin
+from shapely.geometry import box
+from tqdm import tqdm
+from get_land_usage_gpkg import download_gpkg, getLkTree, loadInnerTree, index_path
+from download_open_data import DownloadOpenData
+
+# inside the land use index, so the rasters are rebuilt together with it when the gpkg changes
+raster_path = f'{index_path}/raster'
+
+def tileName(x: str, y: str):
+    """ Name of the DOP40 tile (as downloaded) of the UTM coordinates of its lower left corner. """
+    return f'32{x[:-3]}_{y[:-3]}'
+
+def tileBounds(tile_name: str, tile_size_m: int = 1000):
+    """ xmin, ymin, xmax, ymax of a DOP40 tile named <zone><x km>_<y km>. """
+    x_km, y_km = tile_name.split('_')[:2]
+    x = int(x_km[2:]) * tile_size_m
+    y = int(y_km) * tile_size_m
+    return (x, y, x + tile_size_m, y + tile_size_m)
+
+
+class LandUseRaster:
+    """
+    The usable land use rasterised onto the 1km DOP40 tile grid (tile_size_px x tile_size_px per tile, aligned to the tile pixels)
+    and stored bit packed per tile. Crops are checked by an array lookup in the mask of their tile
+    and predictions can be masked pixel-wise, without querying any polygon during the forwardpass.
+    """
+
+    def __init__(self, tile_size_px: int = 2500, tile_size_m: int = 1000):
+        self.tile_size_px_ = tile_size_px
+        self.tile_size_m_ = tile_size_m
+        self.lk_ = None
+        self.inner_trees_ = {}
+        self.tiles_ = {}
+
+    def rasterFile(self, tile_name):
+        return f'{raster_path}/{tile_name}_{self.tile_size_px_}.npy'
+
+    def innerTree(self, lk):
+        # tiles are built in order, so few districts are needed at a time
+        if lk not in self.inner_trees_:
+            if len(self.inner_trees_) >= 4:
+                del self.inner_trees_[next(iter(self.inner_trees_))]
+            self.inner_trees_[lk] = loadInnerTree(lk)[0]
+        return self.inner_trees_[lk]
+
+    def loadIndex(self):
+        """
+        Loads the district tree once, before any stored raster is used: getLkTree checks the land use index
+        and removes it (with the rasters inside) if the gpkg changed, so no outdated raster is read.
+        """
+        if self.lk_ is None:
+            download_gpkg('forwardpass/data/alkis')
+            self.lk_ = getLkTree()
+        return self.lk_
+
+    def buildTile(self, tile_name):
+        """ Rasterises the usable land use polygons of the tile and saves them bit packed, returns the boolean mask. """
+        lk_tree, lk = self.loadIndex()
+        bounds = tileBounds(tile_name, self.tile_size_m_)
+        tile_box = box(*bounds)
+        pixel_size = self.tile_size_m_ / self.tile_size_px_
+        transform = from_origin(bounds[0], bounds[3], pixel_size, pixel_size)
+        mask = np.zeros((self.tile_size_px_, self.tile_size_px_), dtype=np.uint8)
+        for lk_i in lk_tree.query(tile_box, predicate='intersects'):
+            inner_tree = self.innerTree(lk[lk_i][0])
+            geoms = inner_tree.geometries.take(inner_tree.query(tile_box, predicate='intersects'))
+            if len(geoms):
+                # all_touched: a crop touching a usable polygon is kept, as by the vector check
+                features.rasterize(geoms, out=mask, transform=transform, default_value=1, all_touched=True)
+
+        os.makedirs(raster_path, exist_ok=True)
+        with open(f'{self.rasterFile(tile_name)}.tmp', 'wb') as f:
+            np.save(f, np.packbits(mask, axis=1))
+        os.replace(f'{self.rasterFile(tile_name)}.tmp', self.rasterFile(tile_name))
+        return mask.astype(bool)
+
+    def buildTiles(self, tile_names):
+        """ Offline stage: rasterises all tiles that are not rasterised yet (for the current index). """
+        self.loadIndex()
+        for tile_name in tqdm(sorted(tile_names), desc='Rasterising land use'):
+            if not os.path.exists(self.rasterFile(tile_name)):
+                self.buildTile(tile_name)
+
+    def getTile(self, tile_name):
+        """ Returns the boolean mask of the tile (rasterised first if needed). """
+        if tile_name not in self.tiles_:
+            self.loadIndex()
+            if os.path.exists(self.rasterFile(tile_name)):
+                mask = np.unpackbits(np.load(self.rasterFile(tile_name)), axis=1, count=self.tile_size_px_).view(bool)
+            else:
+                mask = self.buildTile(tile_name)
+            if len(self.tiles_) >= 4:
+                del self.tiles_[next(iter(self.tiles_))]
+            self.tiles_[tile_name] = mask
+        return self.tiles_[tile_name]
+
+    def cropWindow(self, tile_name, geo_info):
+        """ Pixel window (xmin, ymin, xmax, ymax) of a crop geo_info (x_min, y_max, x_max, y_min, ...) inside its tile. """
+        bounds = tileBounds(tile_name, self.tile_size_m_)
+        px = self.tile_size_px_ / self.tile_size_m_
+        return (int(round((geo_info[0] - bounds[0]) * px)), int(round((bounds[3] - geo_info[1]) * px)),
+                int(round((geo_info[2] - bounds[0]) * px)), int(round((bounds[3] - geo_info[3]) * px)))
+
+    def usableCrop(self, tile_name, coos):
+        """ True if any pixel of the window coos (xmin, ymin, xmax, ymax in px) of the tile is usable. """
+        return bool(self.getTile(tile_name)[coos[1]:coos[3], coos[0]:coos[2]].any())
+
+    def maskCrop(self, tile_name, geo_info, pred):
+        """ Sets the prediction of a crop to 0 outside of the usable land use. """
+        x0, y0, x1, y1 = self.cropWindow(tile_name, geo_info)
+        return np.where(self.getTile(tile_name)[y0:y1, x0:x1], pred, 0)
+
+    def maskTile(self, tile_name, pred):
+        """ Sets the prediction of a whole tile to 0 outside of the usable land use. """
+        return np.where(self.getTile(tile_name), pred, 0)
+
+    def checkGeoList(self, geo_list, img_path=None):
+        """
+        Same as get_land_usage_gpkg.checkGeoList, but looked up in the rasters:
+        returns the needed crops (<tile>_<q>_) and deletes the others (if img_path is given)
+        """
+        needed_list = []
+        for f_name in geo_list:
+            tile_name = f_name[:-1].rsplit('_', 1)[0]
+            if self.usableCrop(tile_name, self.cropWindow(tile_name, geo_list[f_name])):
+                needed_list.append(f_name)
+            elif img_path is not None:
+                os.remove(f'{img_path}/{f_name}.png')
+        return needed_list
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--lat_1', type=float)
+    parser.add_argument('--lon_1', type=float)
+    parser.add_argument('--lat_2', type=float)
+    parser.add_argument('--lon_2', type=float)
+    parser.add_argument('--tile_size_px', type=int, default=2500)
+    args = parser.parse_args()
+
+    download_ = DownloadOpenData()
+    x1, y1 = download_.trafo_wgs84_etrs89(args.lat_1, args.lon_1)
+    x2, y2 = download_.trafo_wgs84_etrs89(args.lat_2, args.lon_2)
+    x1, y1, x2, y2 = str(int(x1)), str(int(y1)), str(int(x2)), str(int(y2))
+    download_.check_utm_coos(x1, y1, x2, y2)
+    tiles = [tileName(x, y) for x, y in download_.calculate_needed_tiles(x1, y1, x2, y2)]
+    LandUseRaster(args.tile_size_px).buildTiles(tiles)
\ No newline at end of file
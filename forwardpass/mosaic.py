@@ -0,0 +1,40 @@
+import numpy as np
+
+def blend_weight(size):
+    """
+    Weight of a window for blending overlaps: rises linearly from the border to the center,
+    so the less reliable window borders count less. Every pixel keeps a weight > 0.
+    """
+    ramp = np.minimum(np.arange(1, size + 1), np.arange(size, 0, -1)).astype(np.float32)
+    ramp /= ramp.max()
+    return np.outer(ramp, ramp)
+
+class MaskCanvas:
+    """
+    Accumulates overlapping window predictions of one tile into one preallocated float32 canvas.
+    mode: 'mean' (weighted mean of the overlapping windows) or 'max' (maximum, the union of the thresholded windows)
+    """
+
+    def __init__(self, height, width, mode='mean'):
+        if mode not in ('mean', 'max'):
+            raise ValueError(f'Unknown merge mode {mode}, use mean or max')
+        self.mode_ = mode
+        self.sum_ = np.zeros((height, width), dtype=np.float32)
+        self.weight_ = np.zeros((height, width), dtype=np.float32) if mode == 'mean' else None
+
+    def add(self, coos, pred, weight=None):
+        """ Adds the prediction of the window coos (xmin, ymin, xmax, ymax in px). """
+        window = (slice(coos[1], coos[3]), slice(coos[0], coos[2]))
+        if self.mode_ == 'max':
+            np.maximum(self.sum_[window], pred, out=self.sum_[window])
+            return
+        if weight is None:
+            weight = np.ones(pred.shape, dtype=np.float32)
+        self.sum_[window] += pred * weight
+        self.weight_[window] += weight
+
+    def result(self):
+        """ Returns the merged canvas, pixels without any window are 0. """
+        if self.mode_ == 'max':
+            return self.sum_
+        return np.divide(self.sum_, self.weight_, out=np.zeros_like(self.sum_), where=self.weight_ > 0)
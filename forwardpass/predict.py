@@ -0,0 +1,54 @@
+import numpy as np
+import torch
+import torch.nn.functional as F
+import yaml
+
+import datasets
+import models
+
+
+class Predictor:
+    """ Loads a trained SAM-adapter once and predicts masks for in-memory images. """
+
+    def __init__(self, config_path: str, model_path: str, device: torch.device = None, batch_size: int = None):
+        with open(config_path, 'r') as f:
+            self.config = yaml.load(f, Loader=yaml.FullLoader)
+
+        if device is None:
+            device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+        self.device = device
+
+        # the fw wrapper is only used for its transform (resize + normalize), the images come from memory
+        spec = self.config['fw_dataset']
+        self.img_transform = datasets.make(spec['wrapper'], args={'dataset': []}).img_transform
+        self.batch_size = batch_size or spec['batch_size']
+        # images of this size are fed natively, all others are resized to it
+        self.inp_size = spec['wrapper']['args']['inp_size']
+
+        self.model = models.make(self.config['model']).to(self.device)
+        sam_checkpoint = torch.load(model_path, map_location=self.device)
+        self.model.load_state_dict(sam_checkpoint, strict=True)
+        self.model.eval()
+
+    def predict(self, image, out_size: int) -> np.ndarray:
+        """ Predicts the PV probability (0-1) of a PIL image, returned as out_size x out_size array. """
+        return self.predict_batch([image], out_size)[0]
+
+    @torch.no_grad()
+    def predict_batch(self, images: list, out_size: int) -> np.ndarray:
+        """ Predicts a list of PIL images in one model call, returned as len(images) x out_size x out_size array. """
+        inp = torch.stack([self.img_transform(image.convert('RGB')) for image in images]).to(self.device)
+        pred = torch.sigmoid(self.model.infer(inp))
+        pred = F.interpolate(pred, (out_size, out_size), mode='bilinear', align_corners=False)
+        return pred[:, 0].cpu().numpy()
+
+    def predict_stream(self, items, out_size: int):
+        """ Predicts (image, ...) tuples batch_size at a time and yields every tuple together with its prediction. """
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) == self.batch_size:
+                yield from zip(batch, self.predict_batch([b[0] for b in batch], out_size))
+                batch = []
+        if batch:
+            yield from zip(batch, self.predict_batch([b[0] for b in batch], out_size))
@@ -2,38 +2,157 @@ import sys
 import os
 
 #adding path to the some modules
-for modules in ['preprocessing', 'postprocessing']:
+for modules in ['.', 'preprocessing', 'postprocessing']:
     path = os.path.abspath(modules)
     sys.path.append(path)
 
+import time
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
 from download_open_data import DownloadOpenData
 from split_return import Split
 from save_img_mask import Save
 from ma_make_overlay import *
 import argparse
-from save_geo import run_save_geotiff
+from save_geo import saveGeotiffArray, saveTileGeotiff, writeVrt
 from get_land_usage_gpkg import checkGeoList
-from calc_area import main as calc_area
+from calc_area import calc_area_dict, print_area, get_tile_bounds, get_window
+from predict import Predictor
+from tiled_inference import TiledInference
+from mosaic import MaskCanvas
+from land_use_raster import LandUseRaster
+
+def get_land_use_check(land_use, mask_land_use):
+    """ Returns the check of the needed crops (vector or raster land use) and the raster to mask the predictions with (or None). """
+    land_use_raster = LandUseRaster(2500, 1000) if land_use == 'raster' or mask_land_use else None
+    check = land_use_raster.checkGeoList if land_use == 'raster' else checkGeoList
+    return check, land_use_raster if mask_land_use else None
+
+def run(lat_1, lon_1, lat_2, lon_2, config, model, output_folder, batch_size=None, split_size=256, native=False,
+        land_use='vector', mask_land_use=False, save_split=True, output='crops', merge='max'):
+    predictor = Predictor(config, model, batch_size=batch_size)
+    if native:
+        # split directly into crops of the model input size, they are fed without upscaling
+        split_size = predictor.inp_size
 
-def run(lat_1, lon_1, lat_2, lon_2, config, model, output_folder):
     download_ = DownloadOpenData()
     download_.wgs84_download(lat_1, lon_1, lat_2, lon_2, f'{output_folder}/tiles_download')
 
-    split = Split(2500, 256)
-    images, geo_infos = split.splitImages(f'{output_folder}/tiles_download')
+    split = Split(2500, split_size)
+    geo_infos = split.splitGeoInfos(f'{output_folder}/tiles_download')
+
+    # the land use is checked on the geo_infos in memory, so only the needed crops are ever read and encoded
+    check, land_use_raster = get_land_use_check(land_use, mask_land_use)
+    needed = set(check(geo_infos))
+
+    # crops are read window by window while they are predicted, they are never all in memory
+    images = ((Image.fromarray(array), image_name, q) for array, image_name, q, _ in
+              split.iterImages(f'{output_folder}/tiles_download', needed))
+    if save_split:
+        save_ = Save()
+        images = save_.saveImgIter(f'{output_folder}/split_img', images, '')
+
+    predict_images(predictor, images, geo_infos, len(needed), output_folder, 2500, 1000, land_use_raster, output, merge)
+
+def run_tiles(lat_1, lon_1, lat_2, lon_2, config, model, output_folder, batch_size=None, split_size=256, native=False,
+              land_use='vector', mask_land_use=False):
+    """ Predicts every downloaded tile as a whole (blended overlapping windows) and writes one mask per tile. """
+    predictor = Predictor(config, model, batch_size=batch_size)
+    if native:
+        split_size = predictor.inp_size
+
+    download_ = DownloadOpenData()
+    download_.wgs84_download(lat_1, lon_1, lat_2, lon_2, f'{output_folder}/tiles_download')
+
+    tiled = TiledInference(predictor, split_size)
+    tile_folder = f'{output_folder}/tiles_download'
+    geo_infos = {}
+    for filename in os.listdir(tile_folder):
+        geo_infos.update(tiled.windowGeoInfos(f'{tile_folder}/{filename}'))
+
+    # windows (q) needed per tile, names are <tile>_<q>_
+    check, land_use_raster = get_land_use_check(land_use, mask_land_use)
+    windows = {}
+    for f_name in check(geo_infos):
+        tile_name, q = f_name[:-1].rsplit('_', 1)
+        windows.setdefault(tile_name, set()).add(int(q))
 
-    save_ = Save()
-    save_.saveImg(f'{output_folder}/split_img', images, '')
+    area = 0
+    n_tiles = 0
+    timer = time.time()
+    for tile_name in tqdm(sorted(windows), desc='Predicting tiles'):
+        tif_path = f'{tile_folder}/{tile_name}.tif'
+        pred = tiled.predictTile(tif_path, windows[tile_name])
+        if land_use_raster is not None:
+            pred = land_use_raster.maskTile(tile_name, pred)
+        saveTileGeotiff(pred, tif_path, f'{output_folder}/tile_masks/{tile_name}.tif')
+        area += (pred > 0.5).sum() * (1000 / pred.shape[0]) ** 2
+        n_tiles += 1
+    print(f'Predicted {n_tiles} tiles in {time.time() - timer:.1f}s')
+    print_area(area, n_tiles, 1000)
 
-    checkGeoList(geo_infos, f'{output_folder}/split_img')
+def finish_tile(tile, split_tile_dict, canvas, output_folder, tile_size_px, tile_size_m):
+    """ Returns the area of a completely predicted tile, the mosaic of the tile (canvas, if given) is saved first. """
+    if canvas is not None:
+        pred = canvas.result()
+        saveTileGeotiff(pred, f'{output_folder}/tiles_download/{tile}.tif', f'{output_folder}/tile_masks/{tile}.tif')
+        return (pred > 0.5).sum() * (tile_size_m / tile_size_px) ** 2
+    return calc_area_dict(split_tile_dict, tile_size_px, tile_size_m)
 
-    os.system(f'python fw_cuda.py --config {config} --model {model} --output_dir {output_folder}/pred_masks')
+def predict_images(predictor, images, geo_infos, n_images, output_folder, tile_size_px, tile_size_m, land_use_raster=None,
+                   output='crops', merge='max'):
+    """
+    Predicts the needed split images (iterable of (PIL image, image_name, q), n_images long) and streams the masks to the overlay, GeoTIFF and area calculation.
+    land_use_raster: optional LandUseRaster, the predictions are set to 0 outside of the usable land use
+    output: crops (one GeoTIFF per crop), vrt (crops + one VRT over all of them, geotiff.vrt)
+            or mosaic (one GeoTIFF per downloaded tile in tile_masks/, overlapping crops merged by merge: max or mean)
+    """
+    area = 0
+    n_tiles = 0
+    tile = None
+    split_tile_dict = {}
+    canvas = None
+    crop_tifs = []
+    size = next(iter(geo_infos.values()))[4] if geo_infos else 0
+    timer = time.time()
+    for (image, image_name, q), pred in tqdm(predictor.predict_stream(images, size),
+                                             total=n_images, desc='Predicting masks'):
+        f_name = f'{image_name}_{q}_'
+        # images of one tile are consecutive, so the previous tile is complete
+        if image_name != tile:
+            if tile is not None:
+                area += finish_tile(tile, split_tile_dict, canvas, output_folder, tile_size_px, tile_size_m)
+            split_tile_dict = {}
+            tile = image_name
+            n_tiles += 1
+            if output == 'mosaic':
+                canvas = MaskCanvas(tile_size_px, tile_size_px, merge)
+                tile_bounds = get_tile_bounds(f'{tile}.tif', f'{output_folder}/tiles_download')
 
-    run_overlay(f'{output_folder}/split_img', f'{output_folder}/pred_masks/png', f'{output_folder}/overlay')
+        geo_info = geo_infos[f_name]
+        if land_use_raster is not None:
+            pred = land_use_raster.maskCrop(image_name, geo_info, pred)
+        binary = pred > 0.5
+        #geo_info: xmin, ymax, xmax, ymin --> bounds: xmin, ymin, xmax, ymax
+        bounds = (geo_info[0], geo_info[3], geo_info[2], geo_info[1])
 
-    run_save_geotiff(f'{output_folder}/pred_masks/png', geo_infos, f'{output_folder}/geotiff')
+        save_overlay(np.asarray(image.convert('RGB')), binary, f'{output_folder}/overlay', f_name)
+        if output == 'mosaic':
+            rows, cols = get_window(bounds, tile_bounds[:2], tile_size_px, tile_size_m).toslices()
+            canvas.add((cols.start, rows.start, cols.stop, rows.stop), pred)
+        else:
+            saveGeotiffArray(pred, geo_info, f'{output_folder}/geotiff/{f_name}.tif')
+            crop_tifs.append(f'{output_folder}/geotiff/{f_name}.tif')
+            split_tile_dict[f_name] = (bounds, binary.astype(int))
 
-    calc_area(f'{output_folder}/geotiff', 2500, 1000)
+    if tile is not None:
+        area += finish_tile(tile, split_tile_dict, canvas, output_folder, tile_size_px, tile_size_m)
+    if output == 'vrt' and crop_tifs:
+        writeVrt(crop_tifs, f'{output_folder}/geotiff.vrt')
+    timer = time.time() - timer
+    print(f'Predicted {n_images} tiles in {timer:.1f}s ({n_images/max(timer, 1e-9):.2f} tiles/s)')
+    print_area(area, n_tiles, tile_size_m)
 
 
 if __name__ == '__main__':
@@ -45,6 +164,15 @@ if __name__ == '__main__':
     parser.add_argument('--config', type=str, default='configs/ma_B_cuda.yaml')
     parser.add_argument('--model', type=str)
     parser.add_argument('--output_folder', type=str, default='forwardpass/data')
+    parser.add_argument('--batch-size', type=int, default=None, help='default: fw_dataset batch_size of the config')
+    parser.add_argument('--split_size', type=int, default=256, help='size of the crops the tiles are split into, they are resized to the model input size')
+    parser.add_argument('--mode', type=str, default='crops', choices=['crops', 'tiles'], help='crops: one mask per crop, tiles: one blended mask per downloaded tile')
+    parser.add_argument('--output', type=str, default='crops', choices=['crops', 'vrt', 'mosaic'], help='crops mode: crops (one GeoTIFF per crop), vrt (crops + one VRT over them) or mosaic (one GeoTIFF per tile)')
+    parser.add_argument('--merge', type=str, default='max', choices=['max', 'mean'], help='--output mosaic: merge overlapping crops by max (union) or mean')
+    parser.add_argument('--native', action='store_true', help='split into crops of the model input size (no upscaling), overrides --split_size')
+    parser.add_argument('--land_use', type=str, default='vector', choices=['vector', 'raster'], help='vector: check the crops against the land use polygons, raster: against the pre-rasterised land use tiles (land_use_raster.py)')
+    parser.add_argument('--no_split_img', action='store_true', help='crops mode: keep the split images in memory only, don\'t save them to split_img')
+    parser.add_argument('--mask_land_use', action='store_true', help='set the predictions outside of the usable land use to 0 (pixel-wise, rasterised land use)')
 
     args = parser.parse_args()
 
@@ -55,5 +183,16 @@ if __name__ == '__main__':
     config = args.config
     model = args.model
     output_folder = args.output_folder
+    batch_size = args.batch_size
+    split_size = args.split_size
+    native = args.native
+    land_use = args.land_use
+    mask_land_use = args.mask_land_use
+    save_split = not args.no_split_img
+    output = args.output
+    merge = args.merge
 
-    run(lat_1, lon_1, lat_2, lon_2, config, model, output_folder)
\ No newline at end of file
+    if args.mode == 'tiles':
+        run_tiles(lat_1, lon_1, lat_2, lon_2, config, model, output_folder, batch_size, split_size, native, land_use, mask_land_use)
+    else:
+        run(lat_1, lon_1, lat_2, lon_2, config, model, output_folder, batch_size, split_size, native, land_use, mask_land_use, save_split, output, merge)
\ No newline at end of file
@@ -1,35 +1,98 @@
 from PIL import Image
 import numpy as np
 import rasterio
+import rasterio.shutil
+from rasterio.io import MemoryFile
 from rasterio.transform import from_origin
 import os
 import cv2 as cv
 from tqdm import tqdm
+from xml.sax.saxutils import escape
 
 def saveGeotiff(image_path, geo_info, output_path):
     # Open the image and convert it to numpy array
     img = Image.open(image_path)
     numpy_img = np.array(img)
     numpy_img = cv.resize(numpy_img, (geo_info[4], geo_info[4]))
+    if numpy_img.ndim == 3:
+        numpy_img = numpy_img[:,:,0]
+    # the png holds the probability as 0-255 grayscale
+    if numpy_img.dtype == np.uint8:
+        numpy_img = numpy_img / 255
     binary_img = numpy_img > 0.5
-    binary_img = binary_img.astype(int)
-    binary_img = binary_img[:,:,0]
+    writeGeotiff(binary_img, geo_info, output_path)
 
+def saveGeotiffArray(pred, geo_info, output_path, threshold=0.5):
+    # pred is the predicted probability (0-1) already resized to the tile size
+    binary_img = pred > threshold
+    writeGeotiff(binary_img, geo_info, output_path)
+
+def writeGeotiff(binary_img, geo_info, output_path):
     # Create a transform using the geo_info
     # origin is the upper left corner of the image
     pixel_size = (geo_info[2]-geo_info[0])/binary_img.shape[1]
     transform = from_origin(geo_info[0], geo_info[1], pixel_size, pixel_size)
 
-    #create folders if they don't exist
+    writeCog(binary_img, transform, '+proj=utm +zone=32 +ellps=GRS80 +units=m +no_defs', output_path)
+
+def writeCog(binary_img, transform, crs, output_path, nbits=None, blocksize=512):
+    # writes the binary mask as uint8 Cloud-Optimized GeoTIFF: tiled, DEFLATE compressed and with overviews,
+    # so GIS tools open it instantly and it can be read window by window. nbits=1 stores 1 bit per pixel
     os.makedirs(os.path.dirname(output_path), exist_ok=True)
+    options = {'compress': 'deflate', 'blocksize': blocksize, 'overview_resampling': 'nearest'}
+    if nbits is not None:
+        options['nbits'] = nbits
+    with MemoryFile() as memfile:
+        with memfile.open(driver='GTiff', height=binary_img.shape[0], width=binary_img.shape[1],
+                          count=1, dtype='uint8', crs=crs, transform=transform) as mem:
+            mem.write(binary_img.astype(np.uint8), indexes=1)
+            rasterio.shutil.copy(mem, output_path, driver='COG', **options)
+
+def saveTileGeotiff(pred, tif_path, output_path, threshold=0.5):
+    # pred is the predicted probability (0-1) of the whole tile tif_path, the mask gets its georeference
+    binary_img = pred > threshold
+    with rasterio.open(tif_path) as tif:
+        transform = tif.transform
+        crs = tif.crs
+    writeCog(binary_img, transform, crs, output_path)
+
+def writeVrt(tif_paths, output_path):
+    # writes a GDAL VRT mosaic over the (mask) GeoTIFFs of the same crs and resolution, opened by GIS tools like one raster.
+    # 0 is nodata of every source, so overlapping masks are merged by max (union)
+    sources = []
+    for tif_path in tif_paths:
+        with rasterio.open(tif_path) as tif:
+            sources.append((tif_path, tif.bounds, tif.width, tif.height, tif.res, tif.crs, tif.block_shapes[0]))
+    res = sources[0][4]
+    x_min = min(source[1].left for source in sources)
+    y_max = max(source[1].top for source in sources)
+    x_max = max(source[1].right for source in sources)
+    y_min = min(source[1].bottom for source in sources)
+    width = int(round((x_max - x_min) / res[0]))
+    height = int(round((y_max - y_min) / res[1]))
+
+    vrt_dir = os.path.dirname(os.path.abspath(output_path))
+    lines = [f'<VRTDataset rasterXSize="{width}" rasterYSize="{height}">',
+             f'  <SRS>{escape(sources[0][5].to_wkt())}</SRS>',
+             f'  <GeoTransform>{x_min}, {res[0]}, 0, {y_max}, 0, {-res[1]}</GeoTransform>',
+             '  <VRTRasterBand dataType="Byte" band="1">',
+             '    <NoDataValue>0</NoDataValue>']
+    for tif_path, bounds, tif_width, tif_height, _, _, block_shape in sources:
+        x_off = int(round((bounds.left - x_min) / res[0]))
+        y_off = int(round((y_max - bounds.top) / res[1]))
+        lines += ['    <ComplexSource>',
+                  f'      <SourceFilename relativeToVRT="1">{escape(os.path.relpath(os.path.abspath(tif_path), vrt_dir))}</SourceFilename>',
+                  '      <SourceBand>1</SourceBand>',
+                  f'      <SourceProperties RasterXSize="{tif_width}" RasterYSize="{tif_height}" DataType="Byte" BlockXSize="{block_shape[1]}" BlockYSize="{block_shape[0]}"/>',
+                  f'      <SrcRect xOff="0" yOff="0" xSize="{tif_width}" ySize="{tif_height}"/>',
+                  f'      <DstRect xOff="{x_off}" yOff="{y_off}" xSize="{tif_width}" ySize="{tif_height}"/>',
+                  '      <NODATA>0</NODATA>',
+                  '    </ComplexSource>']
+    lines += ['  </VRTRasterBand>', '</VRTDataset>']
 
-    # Create a new GeoTIFF file
-    with rasterio.open(output_path, 'w', driver='GTiff', 
-                       height=binary_img.shape[0], width=binary_img.shape[1], 
-                       count=1, dtype=str(binary_img.dtype),
-                       crs='+proj=utm +zone=32 +ellps=GRS80 +units=m +no_defs',
-                       transform=transform) as dst:
-        dst.write(binary_img, indexes=1)
+    os.makedirs(vrt_dir, exist_ok=True)
+    with open(output_path, 'w') as f:
+        f.write('\n'.join(lines))
 
 def run_save_geotiff(pred_path, geo_info, output_path):
     for filename in tqdm(os.listdir(pred_path), desc="Saving GeoTIFFs"):
@@ -0,0 +1,53 @@
+import os
+import numpy as np
+import rasterio
+from PIL import Image
+
+from split_return import Split
+from mosaic import MaskCanvas, blend_weight
+
+
+class TiledInference:
+    """
+    Predicts whole GeoTIFF tiles with overlapping (batched) windows and blends the window
+    predictions into one georeferenced mask per tile.
+    """
+
+    def __init__(self, predictor, window_size, artificial_overlap=0):
+        self.predictor_ = predictor
+        self.window_size_ = window_size
+        self.artificial_overlap_ = artificial_overlap
+        self.weight_ = blend_weight(window_size)
+        self.splits_ = {}
+
+    def getSplit(self, tile_size_px):
+        """ Returns the (cached) split of a tile of tile_size_px into windows. """
+        if tile_size_px not in self.splits_:
+            self.splits_[tile_size_px] = Split(tile_size_px, self.window_size_, self.artificial_overlap_)
+        return self.splits_[tile_size_px]
+
+    def windowGeoInfos(self, tif_path):
+        """ Returns the geo_infos ({<tile>_<q>_: (x_min, y_max, x_max, y_min, size)}) of the windows of a tile without reading it. """
+        tile_name = os.path.basename(tif_path).split('.')[0]
+        with rasterio.open(tif_path) as tif:
+            split = self.getSplit(tif.width)
+            geo_infos = {}
+            for q, coos in enumerate(split.split_coos_):
+                geo_infos.update(split.splitImgGeoInfo(f'{tile_name}_{q}_', tif.bounds, coos))
+        return geo_infos
+
+    def predictTile(self, tif_path, windows=None):
+        """
+        Returns the blended PV probability (0-1) of the tile as float32 array.
+        windows: optional indexes q of the windows to predict, the others stay 0 (e.g. not needed by land use).
+        """
+        with rasterio.open(tif_path) as tif:
+            image = np.moveaxis(tif.read([1, 2, 3]), 0, -1)
+        split = self.getSplit(image.shape[1])
+        canvas = MaskCanvas(image.shape[0], image.shape[1])
+
+        crops = ((Image.fromarray(image[coos[1]:coos[3], coos[0]:coos[2]]), coos)
+                 for q, coos in enumerate(split.split_coos_) if windows is None or q in windows)
+        for (_, coos), pred in self.predictor_.predict_stream(crops, self.window_size_):
+            canvas.add(coos, pred, self.weight_)
+        return canvas.result()
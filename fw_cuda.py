@@ -56,6 +56,7 @@ def eval_psnr(loader, model, output_dir):
 
     pbar = tqdm(loader, leave=False, desc='fw')
     nr = 0
+    timer = utils.Timer()
     for batch in pbar:
         for k, v in batch.items():
             batch[k] = v.cuda()
@@ -65,25 +66,27 @@ def eval_psnr(loader, model, output_dir):
         pred = torch.sigmoid(model.infer(inp))
 
         cpu_pred = pred.cpu()
-        vector_temp = cpu_pred.detach().squeeze().numpy()
-
-        filepath = loader.dataset.dataset.files[nr]
-        nr += 1
-        last = filepath.split('/')[-1]
-        file_name = last.split('.')[0]
-        save_path_img = f'{output_dir}/png'
-        save_path_np = f'{output_dir}/numpy'
-        try:
-            np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
-            
-        except:
-            os.makedirs(save_path_np)
-            np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
-        try:
-            plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
-        except:
-            os.makedirs(save_path_img)
-            plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
+        for vector_temp in cpu_pred.detach()[:, 0].numpy():
+            filepath = loader.dataset.dataset.files[nr]
+            nr += 1
+            last = filepath.split('/')[-1]
+            file_name = last.split('.')[0]
+            save_path_img = f'{output_dir}/png'
+            save_path_np = f'{output_dir}/numpy'
+            try:
+                np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
+
+            except:
+                os.makedirs(save_path_np)
+                np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
+            try:
+                plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
+            except:
+                os.makedirs(save_path_img)
+                plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
+
+    t = timer.t()
+    print(f'{nr} tiles in {utils.time_text(t)} ({nr / t:.2f} tiles/s)')
 
 
 if __name__ == '__main__':
@@ -92,6 +95,7 @@ if __name__ == '__main__':
         parser.add_argument('--config')
         parser.add_argument('--model')
         parser.add_argument('--output_dir', default='output')
+        parser.add_argument('--batch-size', type=int, default=None, help='default: fw_dataset batch_size of the config')
         args = parser.parse_args()
 
         with open(args.config, 'r') as f:
@@ -99,7 +103,7 @@ if __name__ == '__main__':
         spec = config['fw_dataset']
         dataset = datasets.make(spec['dataset'])
         dataset = datasets.make(spec['wrapper'], args={'dataset': dataset})
-        loader = DataLoader(dataset, batch_size=spec['batch_size'],
+        loader = DataLoader(dataset, batch_size=args.batch_size or spec['batch_size'],
                             num_workers=8)
     
         model = models.make(config['model']).cuda()
@@ -41,6 +41,8 @@ class ImageEncoderViT(nn.Module):
         rel_pos_zero_init: bool = True,
         window_size: int = 0,
         global_attn_indexes: Tuple[int, ...] = (),
+        attn_backend: str = 'math',
+        attn_chunk_size: int = 1024,
     ) -> None:
         """
         Args:
@@ -59,6 +61,8 @@ class ImageEncoderViT(nn.Module):
             rel_pos_zero_init (bool): If True, zero initialize relative positional parameters.
             window_size (int): Window size for window attention blocks.
             global_attn_indexes (list): Indexes for blocks using global attention.
+            attn_backend (str): Attention implementation, 'math', 'sdpa' or 'chunked' (see Attention).
+            attn_chunk_size (int): Number of queries per chunk of the 'chunked' attention backend.
         """
         super().__init__()
         self.img_size = img_size
@@ -92,6 +96,8 @@ class ImageEncoderViT(nn.Module):
                 rel_pos_zero_init=rel_pos_zero_init,
                 window_size=window_size if i not in global_attn_indexes else 0,
                 input_size=(img_size // patch_size, img_size // patch_size),
+                attn_backend=attn_backend,
+                attn_chunk_size=attn_chunk_size,
             )
             self.blocks.append(block)
 
@@ -135,14 +141,14 @@ class ImageEncoderViT(nn.Module):
 
         embedding_feature = self.prompt_generator.init_embeddings(x)
         handcrafted_feature = self.prompt_generator.init_handcrafted(inp)
-        prompt = self.prompt_generator.get_prompt(handcrafted_feature, embedding_feature)
+        prompts = self.prompt_generator.iter_prompts(handcrafted_feature, embedding_feature)
         if self.pos_embed is not None:
             x = x + self.pos_embed
 
         B, H, W = x.shape[0], x.shape[1], x.shape[2]
         outs = []
-        for i, blk in enumerate(self.blocks):
-            x = prompt[i].reshape(B, H, W, -1) + x
+        for i, (blk, prompt) in enumerate(zip(self.blocks, prompts)):
+            x = prompt.reshape(B, H, W, -1) + x
             x = blk(x)
             if i in self.out_indices:
                 outs.append(x)
@@ -243,6 +249,9 @@ class PromptGenerator(nn.Module):
                                                    patch_size=patch_size, in_chans=3,
                                                    embed_dim=self.embed_dim//self.scale_factor)
 
+        # high pass masks of the fft, keyed by (size, rate, device)
+        self._fft_masks = {}
+
         self.apply(self._init_weights)
 
     def _init_weights(self, m):
@@ -270,15 +279,26 @@ class PromptGenerator(nn.Module):
         return self.prompt_generator(x)
 
     def get_prompt(self, handcrafted_feature, embedding_feature):
+        return list(self.iter_prompts(handcrafted_feature, embedding_feature))
+
+    def iter_prompts(self, handcrafted_feature, embedding_feature):
+        """
+        Yields the prompt of every block. The lightweight mlps of all blocks get the same input,
+        so they run as one batched matmul on the small (embed_dim // scale_factor) features.
+        The shared mlp up to embed_dim is applied lazily, one full size prompt exists at a time.
+        """
         N, C, H, W = handcrafted_feature.shape
         handcrafted_feature = handcrafted_feature.view(N, C, H*W).permute(0, 2, 1)
-        prompts = []
+        feature = (handcrafted_feature + embedding_feature).reshape(1, N * H * W, C)
+
+        # lightweight_mlp_{i} = Linear + GELU, stacked to depth x C x C (state dict stays unchanged)
+        linears = [getattr(self, 'lightweight_mlp_{}'.format(str(i)))[0] for i in range(self.depth)]
+        weight = torch.stack([linear.weight for linear in linears]).transpose(1, 2)
+        bias = torch.stack([linear.bias for linear in linears]).unsqueeze(1)
+        prompts = F.gelu(torch.baddbmm(bias, feature.expand(self.depth, -1, -1), weight))
+
         for i in range(self.depth):
-            lightweight_mlp = getattr(self, 'lightweight_mlp_{}'.format(str(i)))
-            # prompt = proj_prompt(prompt)
-            prompt = lightweight_mlp(handcrafted_feature + embedding_feature)
-            prompts.append(self.shared_mlp(prompt))
-        return prompts
+            yield self.shared_mlp(prompts[i].view(N, H*W, C))
 
     def forward(self, x):
         if self.input_type == 'laplacian':
@@ -317,26 +337,38 @@ class PromptGenerator(nn.Module):
     def fft(self, x, rate):
         # the smaller rate, the smoother; the larger rate, the darker
         # rate = 4, 8, 16, 32
-        mask = torch.zeros(x.shape).to(x.device)
-        w, h = x.shape[-2:]
-        line = int((w * h * rate) ** .5 // 2)
-        mask[:, :, w//2-line:w//2+line, h//2-line:h//2+line] = 1
-
-        fft = torch.fft.fftshift(torch.fft.fft2(x, norm="forward"))
-        # mask[fft.float() > self.freq_nums] = 1
-        # high pass: 1-mask, low pass: mask
-        fft = fft * (1 - mask)
-        # fft = fft * mask
-        fr = fft.real
-        fi = fft.imag
-
-        fft_hires = torch.fft.ifftshift(torch.complex(fr, fi))
-        inv = torch.fft.ifft2(fft_hires, norm="forward").real
+        # high pass: 1-mask, low pass: mask (see fft_mask)
+        mask = self.fft_mask(x.shape[-2:], rate, x.device)
+
+        # x is real, so the half spectrum of rfft2 is enough
+        fft = torch.fft.rfft2(x, norm="forward")
+        fft = fft * mask
+        inv = torch.fft.irfft2(fft, s=x.shape[-2:], norm="forward")
 
         inv = torch.abs(inv)
 
         return inv
 
+    def fft_mask(self, size, rate, device):
+        """
+        Returns the high pass mask for the rfft2 spectrum of an image of the given size.
+        The mask only depends on size, rate and device and is built once.
+        """
+        key = (tuple(size), rate, device)
+        if key not in self._fft_masks:
+            w, h = size
+            line = int((w * h * rate) ** .5 // 2)
+            mask = torch.zeros((w, h), device=device)
+            mask[w//2-line:w//2+line, h//2-line:h//2+line] = 1
+            # the square is centered on the fftshift-ed spectrum, rfft2 uses the unshifted layout
+            mask = torch.fft.ifftshift(mask)
+            # the square holds the frequency -line but not +line, keeping the real part of the complex
+            # inverse (as the full fft2 version did) equals filtering with the mask averaged with its
+            # point reflection, which is symmetric and therefore valid for the real fft
+            mask = (mask + torch.roll(torch.flip(mask, (0, 1)), (1, 1), (0, 1))) / 2
+            self._fft_masks[key] = (1 - mask)[:, :h//2+1]
+        return self._fft_masks[key]
+
 class PatchEmbed2(nn.Module):
     """ Image to Patch Embedding
     """
@@ -380,6 +412,8 @@ class Block(nn.Module):
         rel_pos_zero_init: bool = True,
         window_size: int = 0,
         input_size: Optional[Tuple[int, int]] = None,
+        attn_backend: str = 'math',
+        attn_chunk_size: int = 1024,
     ) -> None:
         """
         Args:
@@ -395,6 +429,8 @@ class Block(nn.Module):
                 use global attention.
             input_size (tuple(int, int) or None): Input resolution for calculating the relative
                 positional parameter size.
+            attn_backend (str): Attention implementation, 'math', 'sdpa' or 'chunked'.
+            attn_chunk_size (int): Number of queries per chunk of the 'chunked' attention backend.
         """
         super().__init__()
         self.norm1 = norm_layer(dim)
@@ -405,6 +441,8 @@ class Block(nn.Module):
             use_rel_pos=use_rel_pos,
             rel_pos_zero_init=rel_pos_zero_init,
             input_size=input_size if window_size == 0 else (window_size, window_size),
+            attn_backend=attn_backend,
+            attn_chunk_size=attn_chunk_size,
         )
 
         self.norm2 = norm_layer(dim)
@@ -442,6 +480,8 @@ class Attention(nn.Module):
         use_rel_pos: bool = False,
         rel_pos_zero_init: bool = True,
         input_size: Optional[Tuple[int, int]] = None,
+        attn_backend: str = 'math',
+        attn_chunk_size: int = 1024,
     ) -> None:
         """
         Args:
@@ -452,8 +492,17 @@ class Attention(nn.Module):
             rel_pos_zero_init (bool): If True, zero initialize relative positional parameters.
             input_size (tuple(int, int) or None): Input resolution for calculating the relative
                 positional parameter size.
+            attn_backend (str): 'math' materialises the full (B * nHead, H * W, H * W) attention map,
+                'sdpa' uses torch's fused scaled_dot_product_attention and 'chunked' runs it for
+                attn_chunk_size queries at a time, so only a (chunk, H * W) part of the map exists.
+                The relative position bias is added in all of them.
+            attn_chunk_size (int): Number of queries per chunk of the 'chunked' backend.
         """
         super().__init__()
+        if attn_backend not in ('math', 'sdpa', 'chunked'):
+            raise ValueError(f"Unknown attention backend {attn_backend}, use 'math', 'sdpa' or 'chunked'")
+        self.attn_backend = attn_backend
+        self.attn_chunk_size = attn_chunk_size
         self.num_heads = num_heads
         head_dim = dim // num_heads
         self.scale = head_dim**-0.5
@@ -477,17 +526,66 @@ class Attention(nn.Module):
         # q, k, v with shape (B * nHead, H * W, C)
         q, k, v = qkv.reshape(3, B * self.num_heads, H * W, -1).unbind(0)
 
-        attn = (q * self.scale) @ k.transpose(-2, -1)
+        if self.attn_backend == 'math':
+            attn = (q * self.scale) @ k.transpose(-2, -1)
 
-        if self.use_rel_pos:
-            attn = add_decomposed_rel_pos(attn, q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W))
+            if self.use_rel_pos:
+                attn = add_decomposed_rel_pos(attn, q, self.rel_pos_h, self.rel_pos_w, (H, W), (H, W))
 
-        attn = attn.softmax(dim=-1)
-        x = (attn @ v).view(B, self.num_heads, H, W, -1).permute(0, 2, 3, 1, 4).reshape(B, H, W, -1)
+            attn = attn.softmax(dim=-1)
+            x = attn @ v
+        else:
+            x = self.chunked_attention(q, k, v, (H, W))
+
+        x = x.view(B, self.num_heads, H, W, -1).permute(0, 2, 3, 1, 4).reshape(B, H, W, -1)
         x = self.proj(x)
 
         return x
 
+    def chunked_attention(self, q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, hw: Tuple[int, int]) -> torch.Tensor:
+        """
+        Attention of the 'sdpa' (one chunk) and 'chunked' backends with the decomposed relative
+        position bias built per chunk of queries.
+        Args:
+            q, k, v (Tensor): query, key and value with shape (B * nHead, H * W, C).
+            hw (Tuple): spatial size (H, W) of the tokens.
+
+        Returns:
+            x (Tensor): attention output with shape (B * nHead, H * W, C).
+        """
+        H, W = hw
+        if self.use_rel_pos:
+            # the bias is rel_h[q, k_h] + rel_w[q, k_w], only these (H * W, H + W) terms are kept
+            Rh = get_rel_pos(H, H, self.rel_pos_h)
+            Rw = get_rel_pos(W, W, self.rel_pos_w)
+            r_q = q.reshape(q.shape[0], H, W, -1)
+            rel_h = torch.einsum("bhwc,hkc->bhwk", r_q, Rh).reshape(q.shape[0], H * W, H, 1)
+            rel_w = torch.einsum("bhwc,wkc->bhwk", r_q, Rw).reshape(q.shape[0], H * W, 1, W)
+
+        chunk_size = H * W if self.attn_backend == 'sdpa' else self.attn_chunk_size
+        out = []
+        for start in range(0, H * W, chunk_size):
+            end = start + chunk_size
+            bias = None
+            if self.use_rel_pos:
+                bias = (rel_h[:, start:end] + rel_w[:, start:end]).flatten(2)
+            out.append(scaled_dot_product_attention(q[:, start:end], k, v, bias))
+        return torch.cat(out, dim=1)
+
+
+def scaled_dot_product_attention(
+    q: torch.Tensor, k: torch.Tensor, v: torch.Tensor, bias: Optional[torch.Tensor] = None
+) -> torch.Tensor:
+    """
+    softmax(q @ k^T / sqrt(C) + bias) @ v, fused by torch (>= 2.0) if available.
+    """
+    if hasattr(F, 'scaled_dot_product_attention'):
+        return F.scaled_dot_product_attention(q, k, v, attn_mask=bias)
+    attn = (q * q.shape[-1] ** -0.5) @ k.transpose(-2, -1)
+    if bias is not None:
+        attn = attn + bias
+    return attn.softmax(dim=-1) @ v
+
 
 def window_partition(x: torch.Tensor, window_size: int) -> Tuple[torch.Tensor, Tuple[int, int]]:
     """
@@ -113,6 +113,8 @@ class SAM(nn.Module):
             rel_pos_zero_init=True,
             window_size=encoder_mode['window_size'],
             global_attn_indexes=encoder_mode['global_attn_indexes'],
+            attn_backend=encoder_mode.get('attn_backend', 'math'),
+            attn_chunk_size=encoder_mode.get('attn_chunk_size', 1024),
         )
         self.prompt_embed_dim = encoder_mode['prompt_embed_dim']
         self.mask_decoder = MaskDecoder(
@@ -150,6 +152,17 @@ class SAM(nn.Module):
         self.inp_size = inp_size
         self.image_embedding_size = inp_size // encoder_mode['patch_size']
         self.no_mask_embed = nn.Embedding(1, encoder_mode['prompt_embed_dim'])
+        # input independent embeddings, keyed by (name, device, dtype)
+        self._embedding_cache = {}
+
+    def _apply(self, fn, *args, **kwargs):
+        # moving the model (.to(), .cuda(), .half(), ...) replaces the tensors the cache is built from
+        self._embedding_cache = {}
+        return super()._apply(fn, *args, **kwargs)
+
+    def load_state_dict(self, *args, **kwargs):
+        self._embedding_cache = {}
+        return super().load_state_dict(*args, **kwargs)
 
     def set_input(self, input, gt_mask):
         self.input = input.to(self.device)
@@ -164,17 +177,36 @@ class SAM(nn.Module):
           torch.Tensor: Positional encoding with shape
             1x(embed_dim)x(embedding_h)x(embedding_w)
         """
-        return self.pe_layer(self.image_embedding_size).unsqueeze(0)
-
+        gaussian_matrix = self.pe_layer.positional_encoding_gaussian_matrix
+        key = ('dense_pe', gaussian_matrix.device, gaussian_matrix.dtype)
+        if key not in self._embedding_cache:
+            # the gaussian matrix is a buffer and never trained, so the encoding can be reused in training as well
+            self._embedding_cache[key] = self.pe_layer(self.image_embedding_size).unsqueeze(0)
+        return self._embedding_cache[key]
+
+    def get_prompt_embeddings(self, bs, device):
+        """
+        Returns the (empty) sparse and the no-mask dense prompt embeddings
+        for a batch of bs images.
+        """
+        key = ('prompt', device, self.no_mask_embed.weight.dtype)
+        # no_mask_embed is trained, so the cached (gradient free) embeddings are only used for inference
+        if torch.is_grad_enabled() or key not in self._embedding_cache:
+            sparse_embeddings = torch.empty((1, 0, self.prompt_embed_dim), device=device)
+            dense_embeddings = self.no_mask_embed.weight.reshape(1, -1, 1, 1).expand(
+                1, -1, self.image_embedding_size, self.image_embedding_size
+            )
+            if not torch.is_grad_enabled():
+                self._embedding_cache[key] = (sparse_embeddings, dense_embeddings)
+        else:
+            sparse_embeddings, dense_embeddings = self._embedding_cache[key]
+        return sparse_embeddings.expand(bs, -1, -1), dense_embeddings.expand(bs, -1, -1, -1)
 
     def forward(self):
-        bs = 1
+        bs = self.input.shape[0]
 
         # Embed prompts
-        sparse_embeddings = torch.empty((bs, 0, self.prompt_embed_dim), device=self.input.device)
-        dense_embeddings = self.no_mask_embed.weight.reshape(1, -1, 1, 1).expand(
-            bs, -1, self.image_embedding_size, self.image_embedding_size
-        )
+        sparse_embeddings, dense_embeddings = self.get_prompt_embeddings(bs, self.input.device)
 
         self.features = self.image_encoder(self.input)
 
@@ -192,13 +224,10 @@ class SAM(nn.Module):
         self.pred_mask = masks
 
     def infer(self, input):
-        bs = 1
+        bs = input.shape[0]
 
         # Embed prompts
-        sparse_embeddings = torch.empty((bs, 0, self.prompt_embed_dim), device=input.device)
-        dense_embeddings = self.no_mask_embed.weight.reshape(1, -1, 1, 1).expand(
-            bs, -1, self.image_embedding_size, self.image_embedding_size
-        )
+        sparse_embeddings, dense_embeddings = self.get_prompt_embeddings(bs, input.device)
 
         self.features = self.image_encoder(input)
 
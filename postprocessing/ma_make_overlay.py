@@ -11,13 +11,16 @@ def run_overlay(img_folder_path, mask_folder_path, overlay_folder_path):
         img_array = img2np(f'{img_folder_path}/{filename}')
         mask_array = cv2.resize(mask_array, (256, 256))
         mask_array = mask_array[:,:,0:1]
-        overlayed = overlay(img_array, mask_array, (0,255,0), 0.4)
         clean_filename = cleanFilename(filename)
-        try:
-            plt.imsave(f'{overlay_folder_path}/{clean_filename}.png',overlayed)
-        except:
-            os.makedirs(overlay_folder_path)
-            plt.imsave(f'{overlay_folder_path}/{clean_filename}.png',overlayed)
+        save_overlay(img_array, mask_array, overlay_folder_path, clean_filename)
+
+def save_overlay(img_array, mask_array, overlay_folder_path, clean_filename):
+    overlayed = overlay(img_array, mask_array, (0,255,0), 0.4)
+    try:
+        plt.imsave(f'{overlay_folder_path}/{clean_filename}.png',overlayed)
+    except:
+        os.makedirs(overlay_folder_path)
+        plt.imsave(f'{overlay_folder_path}/{clean_filename}.png',overlayed)
 
 def cleanFilename(filename):
     split_list = filename.split('.')
@@ -0,0 +1,46 @@
+import argparse
+import time
+import numpy as np
+
+from masks import MaskMaker
+
+def random_polygons(n, image_size, seed=0):
+    """ n random roof-like quadrilaterals ((row, col) pixel coordinates) inside an image of image_size. """
+    rng = np.random.default_rng(seed)
+    polygons = []
+    for _ in range(n):
+        center = rng.uniform(20, image_size - 20, 2)
+        size = rng.uniform(4, 20, 2)
+        angle = rng.uniform(0, np.pi)
+        corners = np.array([[-1, -1], [-1, 1], [1, 1], [1, -1], [-1, -1]]) * size
+        rotation = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+        polygons.append([tuple(point) for point in corners @ rotation.T + center])
+    return polygons
+
+def benchmark(n_polygons, image_size):
+    """ Compares the point in polygon mask (make_mask per polygon) to burning all polygons at once (burn_mask). """
+    polygons = random_polygons(n_polygons, image_size)
+
+    timer = time.time()
+    legacy = np.zeros((image_size, image_size))
+    for polygon in polygons:
+        legacy += MaskMaker.make_mask(polygon, (image_size, image_size))
+    legacy[legacy > 1] = 1
+    legacy_time = time.time() - timer
+
+    timer = time.time()
+    mask = MaskMaker.burn_mask(polygons, (image_size, image_size))
+    burn_time = time.time() - timer
+
+    differing = np.count_nonzero(mask != legacy)
+    print(f'{n_polygons} polygons on {image_size}x{image_size}px: make_mask {legacy_time:.2f}s, burn_mask {burn_time:.4f}s '
+          f'({legacy_time / burn_time:.0f}x), {differing} of {np.count_nonzero(legacy)} polygon pixels differ')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--polygons', default=100, type=int)
+    parser.add_argument('--inputimgsize', default=2500, type=int)
+    args = parser.parse_args()
+
+    benchmark(args.polygons, args.inputimgsize)
\ No newline at end of file
@@ -0,0 +1,39 @@
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from parallel_split import ParallelSplit
+
+def benchmark(image_filepath, mask_filepath, input_size, split_size, workers_list):
+    """ Splits and saves the same images (and masks) with every number of workers and reports the time and speedup. """
+    base = None
+    for workers in workers_list:
+        out = tempfile.mkdtemp()
+        split = ParallelSplit(input_size, split_size, workers)
+        timer = time.time()
+        n = split.splitSaveImages(image_filepath, f'{out}/img', 'bench')
+        if mask_filepath is not None:
+            n += split.splitSaveMasks(mask_filepath, f'{out}/masks', 'bench')
+        seconds = time.time() - timer
+        base = base or seconds
+        print(f'{workers} workers: {seconds:.1f}s, {n / seconds:.1f} splits/s, speedup {base / seconds:.2f}x')
+        shutil.rmtree(out)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--images', type=str, help='folder of the images to split (e.g. data/masked_images_<name>)')
+    parser.add_argument('--masks', type=str, default=None, help='optional folder of the masks (.npy) to split')
+    parser.add_argument('--inputimgsize', default=2500, type=int)
+    parser.add_argument('--splitsize', default=512, type=int)
+    parser.add_argument('--workers', default=None, type=int, nargs='+', help='numbers of workers to compare, default: 1, 2, 4, ... up to all cores')
+    args = parser.parse_args()
+
+    workers_list = args.workers
+    if workers_list is None:
+        workers_list = [2 ** i for i in range(os.cpu_count().bit_length()) if 2 ** i <= os.cpu_count()]
+        if workers_list[-1] != os.cpu_count():
+            workers_list.append(os.cpu_count())
+    benchmark(args.images, args.masks, args.inputimgsize, args.splitsize, workers_list)
\ No newline at end of file
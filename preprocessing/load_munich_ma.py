@@ -2,11 +2,20 @@ import rasterio
 import os
 import geojson
 import shutil
+import numpy as np
+import shapely
+from shapely.geometry import box
+from shapely.strtree import STRtree
 
 
 class LoadMunich:
 
-    def __init__(self,tif_folder,json_path,city, image_size, utm_size):
+    def __init__(self,tif_folder,json_path,city, image_size, utm_size, source_mode='copy'):
+        #source_mode: how the matched tifs are handed to the split: copy/symlink/hardlink into data/masked_images_<city>/
+        #or manifest (only their paths in data/masked_images_<city>.txt, nothing is copied)
+        if source_mode not in ('copy', 'symlink', 'hardlink', 'manifest'):
+            raise ValueError(f'Unknown source_mode {source_mode}, use copy, symlink, hardlink or manifest')
+        self.source_mode_ = source_mode
         self.tif_folder_ = tif_folder
         self.json_path_ = json_path
         self.city_ = city
@@ -38,46 +47,57 @@ class LoadMunich:
         return out
 
     def buildReadData(self, tif_koos,geojson_poly):
+        #polygon_pixels is keyed by (tif filename, polygon id): a polygon crossing tile borders is part of every tile it touches
         polygon_images = {self.city_:{}}
         polygon_pixels = {}
+        if not tif_koos or not geojson_poly:
+            return polygon_images, polygon_pixels
 
-        for t_id in tif_koos:
-            for j_id in geojson_poly:
-                intile = False
-                #check if first polygon-point is in tile, y than x value
-                #looping through coordinates of the polygon
-                for i in range(len(geojson_poly[j_id]['polygon'])):
-                    dy = geojson_poly[j_id]['polygon'][i][1]-tif_koos[t_id]['ymin']
-                    if dy < self.utm_size_[1] and dy >= 0:
-                        dx = geojson_poly[j_id]['polygon'][i][0]-tif_koos[t_id]['xmin']
-                        if dx < self.utm_size_[0] and dx >= 0:
-                            intile = True
-                if intile:
-                    #proofing if list exists --> append otherwise create
-                    try:
-                        polygon_images[self.city_][tif_koos[t_id]['filename']].append(j_id)
-                    except:
-                        polygon_images[self.city_][tif_koos[t_id]['filename']] = []
-                        polygon_images[self.city_][tif_koos[t_id]['filename']].append(j_id)
-                    polygon_pixels[j_id] = []
-                    #looping through all coordinates per polygon
-                    x_utm_2_pixel = self.image_size_[0]/self.utm_size_[0]
-                    y_utm_2_pixel = self.image_size_[1]/self.utm_size_[1]
-                    for i in range(len(geojson_poly[j_id]['polygon'])):
-                            #tif origin lower left corner, np array origin upper left corner
-                            #Transposed x <> y switched
-                            polygon_pixels[j_id].append((abs((geojson_poly[j_id]['polygon'][i][1]-tif_koos[t_id]['ymin'])*y_utm_2_pixel-self.image_size_[1]),(geojson_poly[j_id]['polygon'][i][0]-tif_koos[t_id]['xmin'])*x_utm_2_pixel))
-                                
+        #spatial index over the tiles (xmin, ymin + utm_size), queried with the bounding boxes of all polygons at once
+        t_ids = list(tif_koos)
+        tile_tree = STRtree([box(tif_koos[t_id]['xmin'], tif_koos[t_id]['ymin'],
+                                 tif_koos[t_id]['xmin']+self.utm_size_[0], tif_koos[t_id]['ymin']+self.utm_size_[1]) for t_id in t_ids])
+        j_ids = list(geojson_poly)
+        polygons = [np.asarray(geojson_poly[j_id]['polygon'], dtype=float)[:, :2] for j_id in j_ids]
+        bounds = np.array([np.concatenate((polygon.min(axis=0), polygon.max(axis=0))) for polygon in polygons])
+        poly_idx, tile_idx = tile_tree.query(shapely.box(bounds[:,0], bounds[:,1], bounds[:,2], bounds[:,3]))
+
+        x_utm_2_pixel = self.image_size_[0]/self.utm_size_[0]
+        y_utm_2_pixel = self.image_size_[1]/self.utm_size_[1]
+        for t_i, p_i in sorted(zip(tile_idx.tolist(), poly_idx.tolist())):
+            tif = tif_koos[t_ids[t_i]]
+            polygon_images[self.city_].setdefault(tif['filename'], []).append((tif['filename'], j_ids[p_i]))
+            #tif origin lower left corner, np array origin upper left corner (vertices above the tile get negative rows)
+            #Transposed x <> y switched
+            rows = self.image_size_[1]-(polygons[p_i][:,1]-tif['ymin'])*y_utm_2_pixel
+            cols = (polygons[p_i][:,0]-tif['xmin'])*x_utm_2_pixel
+            polygon_pixels[(tif['filename'], j_ids[p_i])] = list(zip(rows.tolist(), cols.tolist()))
 
         return polygon_images, polygon_pixels
     
     def copyTif(self,polygon_images):
+        if self.source_mode_ == 'manifest':
+            self.writeManifest(polygon_images)
+            return
+        os.makedirs(f"data/masked_images_{self.city_}", exist_ok=True)
         for image in polygon_images[self.city_]:
-            try:
-                shutil.copyfile(f"{self.tif_folder_}/{image}",f"data/masked_images_{self.city_}/{image}")
-            except IOError:
-                os.makedirs(os.path.dirname(f"data/masked_images_{self.city_}/"))
-                shutil.copyfile(f"{self.tif_folder_}/{image}",f"data/masked_images_{self.city_}/{image}")
+            src = os.path.abspath(f"{self.tif_folder_}/{image}")
+            dst = f"data/masked_images_{self.city_}/{image}"
+            if os.path.lexists(dst):
+                os.remove(dst)
+            if self.source_mode_ == 'symlink':
+                os.symlink(src, dst)
+            elif self.source_mode_ == 'hardlink':
+                os.link(src, dst)
+            else:
+                shutil.copyfile(src, dst)
+
+    def writeManifest(self, polygon_images):
+        #one source path per line, readable by the split instead of a folder
+        os.makedirs("data", exist_ok=True)
+        with open(f"data/masked_images_{self.city_}.txt", 'w') as f:
+            for image in polygon_images[self.city_]:
+                f.write(f"{os.path.abspath(f'{self.tif_folder_}/{image}')}\n")
 
     def run(self):    
         tif_data = self.readTifKoos()
@@ -1,5 +1,6 @@
 import numpy as np
 from matplotlib.path import Path as PolygonPath
+from rasterio import features
 from pathlib import Path
 from tqdm import tqdm
 
@@ -12,18 +13,23 @@ from bounding_box_ma import BoundingBox
 class MaskMaker:
     """This class looks for all files defined in the metadata, and
     produces masks for all of the .tif files saved there.
-    These files will be saved in <org_folder>_mask/<org_filename>.npy
+    These files will be saved in <org_folder>_mask/<org_filename>.npy (uint8 0/1)
+    or, with mask_format='packbits', <org_folder>_mask/<org_filename>.packed.npy (rows bit-packed)
 
     Attributes:
         data_folder: pathlib.Path
             Path of the data folder, which should be set up as described in `data/README.md`
     """
 
-    def __init__(self, geojson_path, images_path, city, image_size, utm_size, data_folder: Path = Path('data')) -> None:
+    def __init__(self, geojson_path, images_path, city, image_size, utm_size, data_folder: Path = Path('data'),
+                 source_mode: str = 'copy', mask_format: str = 'uint8') -> None:
+        if mask_format not in ('uint8', 'packbits'):
+            raise ValueError(f'Unknown mask_format {mask_format}, use uint8 or packbits')
+        self.mask_format = mask_format
         self.data_folder = data_folder
         self.image_size = image_size
         self.utm_size = utm_size
-        self.loader = LoadMunich(images_path,geojson_path,city, self.image_size, self.utm_size)
+        self.loader = LoadMunich(images_path,geojson_path,city, self.image_size, self.utm_size, source_mode)
         self.polygon_images, self.polygon_pixels = self.loader.run()
 
     def process(self) -> None:
@@ -37,14 +43,11 @@ class MaskMaker:
             if not masked_city.exists(): masked_city.mkdir()
 
             for image, polygons in tqdm(files.items()):
-                mask = np.zeros((x_size, y_size))
-                for polygon in polygons:
-                    mask += self.make_mask(self.polygon_pixels[polygon], (x_size, y_size))
+                mask = self.burn_mask([self.polygon_pixels[polygon] for polygon in polygons], (x_size, y_size))
 
-                mask[mask > 1] = 1
                 split_image = image.split('.')
                 image_name = split_image[0]
-                np.save(masked_city / f"{image_name}.npy", mask)
+                self.save_mask(masked_city, image_name, mask)
 
     def process_bounding_box(self):
         boundingbox = BoundingBox()
@@ -60,18 +63,23 @@ class MaskMaker:
             if not masked_city.exists(): masked_city.mkdir()
 
             for image, polygons in tqdm(files.items()):
-                mask = np.zeros((x_size, y_size))
-                for polygon in polygons:
-                    mask += self.make_mask(edges[polygon], (x_size, y_size))
-
-                mask[mask > 1] = 1
+                mask = self.burn_mask([edges[polygon] for polygon in polygons], (x_size, y_size))
 
                 split_image = image.split('.')
                 image_name = split_image[0]
-                np.save(masked_city / f"{image_name}.npy", mask)
+                self.save_mask(masked_city, image_name, mask)
+
 
 
 
+    def save_mask(self, folder: Path, image_name: str, mask: np.array) -> None:
+        """Saves a 0/1 mask as uint8 (1 byte/px) or bit-packed rows (1 bit/px) instead of float64 (8 bytes/px),
+        split_return.openMask reads both memory-mapped.
+        """
+        if self.mask_format == 'packbits':
+            np.save(folder / f"{image_name}.packed.npy", np.packbits(mask > 0, axis=1))
+        else:
+            np.save(folder / f"{image_name}.npy", (mask > 0).astype(np.uint8))
 
     @staticmethod
     def make_mask(coords: List, imsizes: Tuple[int, int]) -> np.array:
@@ -84,4 +92,23 @@ class MaskMaker:
         coors = np.hstack((x.reshape(-1, 1), y.reshape(-1, 1)))
         mask = poly_path.contains_points(coors)
 
-        return mask.reshape(x_size, y_size).astype(float)
\ No newline at end of file
+        return mask.reshape(x_size, y_size).astype(float)
+
+    @staticmethod
+    def burn_mask(polygons: List[List], imsizes: Tuple[int, int]) -> np.array:
+        """Burns all polygons ((row, col) pixel coordinates, as for make_mask) at once into one uint8 mask.
+        A pixel is set if its center lies inside a polygon; the polygons are shifted by half a pixel,
+        so that is the pixel coordinate (row, col) make_mask tests.
+        """
+        shapes = []
+        for coords in polygons:
+            coords = np.asarray(coords, dtype=float)
+            if len(coords) < 3:
+                continue
+            # (row, col) -> (x, y) = (col, row) + half a pixel
+            ring = coords[:, ::-1] + 0.5
+            shapes.append(({'type': 'Polygon', 'coordinates': [ring.tolist()]}, 1))
+
+        if not shapes:
+            return np.zeros(imsizes, dtype=np.uint8)
+        return features.rasterize(shapes, out_shape=imsizes, fill=0, dtype='uint8')
\ No newline at end of file
@@ -1,7 +1,8 @@
 from PIL import Image
-import numpy as np
 import os
 
+from split_return import loadMask
+
 
 class Np2Png:
 
@@ -11,7 +12,7 @@ class Np2Png:
 
     def np_2_png(self):
         for filename in os.listdir(self.src_path_):
-            A = np.load(f"{self.src_path_}/{filename}")
+            A = loadMask(f"{self.src_path_}/{filename}")
             #conv to binary img
             im_bin = A > 0
             im = Image.fromarray(im_bin)
@@ -0,0 +1,51 @@
+from PIL import Image
+import os
+from concurrent.futures import ProcessPoolExecutor
+from tqdm import tqdm
+
+from split_return import Split, listSources, openMask, maskWindow
+
+def saveImageSplits(job):
+    # one source image: crops all splits and saves them as <image_name>_<q>_<json_file>.png (same names as Save.saveImg)
+    image_file, split_coos, folder_path, json_file = job
+    image_name = os.path.basename(image_file).split('.')[0]
+    with Image.open(image_file) as im:
+        for q, coos in enumerate(split_coos):
+            im.crop(coos).save(f'{folder_path}/{image_name}_{q}_{json_file}.png')
+    return len(split_coos)
+
+def saveMaskSplits(job):
+    # one source mask (.npy or .packed.npy, memory-mapped): saves all splits as binary <mask_name>_<q>_<json_file>.png (same names as Save.saveMask)
+    mask_file, split_coos, folder_path, json_file = job
+    mask_name = os.path.basename(mask_file).split('.')[0]
+    mask, packed = openMask(mask_file)
+    for q, coos in enumerate(split_coos):
+        Image.fromarray(maskWindow(mask, packed, coos) > 0).save(f'{folder_path}/{mask_name}_{q}_{json_file}.png')
+    return len(split_coos)
+
+
+class ParallelSplit:
+    """
+    Split + Save in one step: every source image/mask is one task, the tasks are split and PNG encoded by a pool of workers processes.
+    The output names only depend on the source names, so they are the same for any number of workers (and the same as Split + Save).
+    """
+
+    def __init__(self, in_size=2500, dest_size=1024, workers=None):
+        self.split_ = Split(in_size, dest_size)
+        self.workers_ = workers or os.cpu_count()
+
+    def splitSaveImages(self, image_filepath, folder_path, json_file):
+        return self.runJobs(saveImageSplits, image_filepath, folder_path, json_file, f'Saving {json_file} images')
+
+    def splitSaveMasks(self, mask_filepath, folder_path, json_file):
+        return self.runJobs(saveMaskSplits, mask_filepath, folder_path, json_file, f'Saving {json_file} masks')
+
+    def runJobs(self, function, filepath, folder_path, json_file, desc):
+        # returns the number of saved splits
+        os.makedirs(folder_path, exist_ok=True)
+        # filepath: folder, manifest (.txt) or list of source paths
+        jobs = [(source, self.split_.split_coos_, folder_path, json_file) for source in listSources(filepath)]
+        if self.workers_ == 1:
+            return sum(function(job) for job in tqdm(jobs, desc=desc))
+        with ProcessPoolExecutor(max_workers=self.workers_) as executor:
+            return sum(tqdm(executor.map(function, jobs), total=len(jobs), desc=desc))
\ No newline at end of file
@@ -2,30 +2,28 @@ import argparse
 import os
 
 from masks import MaskMaker
-from split_return import Split
-from save_img_mask import Save
+from parallel_split import ParallelSplit
 from np2png_ma import Np2Png
 from rename_union_new_ma import RenameUnion
 from proof_not_empty import Proof
+from stream_pipeline import StreamPipeline
 from train_test_split_ma import TrainTestSplit
 import create_folderstructure
 
 class Run:
-    def runAll(geotif, geojson, input_size, split_size, utm_size, pct_empty):
+    def runAll(geotif, geojson, input_size, split_size, utm_size, pct_empty, workers=1, source_mode='manifest', mask_format='uint8'):
         create_folderstructure.create_folders('all')
 
         for geojson_file in os.listdir(geojson):
             filename = geojson_file.split('.')[0]
-            maskmaker = MaskMaker(f'{geojson}/{geojson_file}', geotif, filename, (input_size, input_size), (utm_size, utm_size))
+            maskmaker = MaskMaker(f'{geojson}/{geojson_file}', geotif, filename, (input_size, input_size), (utm_size, utm_size), source_mode=source_mode, mask_format=mask_format)
             maskmaker.process()
 
-            split = Split(input_size, split_size)
-            images = split.splitImages(f"data/masked_images_{filename}")[0]
-            masks = split.splitMask(f"data/{filename}_masks")
-
-            save_ = Save()
-            save_.saveImg('data/rdy/img', images, filename)
-            save_.saveMask('data/rdy/masks', masks, filename)
+            split = ParallelSplit(input_size, split_size, workers)
+            # manifest: the source tifs are read where they are, listed in data/masked_images_<name>.txt
+            sources = f"data/masked_images_{filename}.txt" if source_mode == 'manifest' else f"data/masked_images_{filename}"
+            split.splitSaveImages(sources, 'data/rdy/img', filename)
+            split.splitSaveMasks(f"data/{filename}_masks", 'data/rdy/masks', filename)
 
 
         proof = Proof('data/rdy/img', 'data/rdy/masks')
@@ -36,19 +34,22 @@ class Run:
 
         test_train_split.split('data/rdy/masks','load/masks')
     
-    def runSplit(split_images, split_masks, geojson, input_size, split_size, pct_empty):
+    def runStream(geotif, geojson, input_size, split_size, utm_size, pct_empty, resume=True):
+        # same data as runAll, but every tile is masked, split, checked and written into load/ in one pass (resumable)
+        create_folderstructure.create_folders('all')
+
+        pipeline = StreamPipeline(geotif, input_size, split_size, utm_size, pct_empty, 'load')
+        pipeline.run(geojson, resume)
+
+    def runSplit(split_images, split_masks, geojson, input_size, split_size, pct_empty, workers=1):
         create_folderstructure.create_folders('all')
 
         for geojson_file in os.listdir(geojson):
             filename = geojson_file.split('.')[0]
 
-            split = Split(input_size, split_size)
-            images = split.splitImages(split_images)[0]
-            masks = split.splitMask(split_masks)
-
-            save_ = Save()
-            save_.saveImg('data/rdy/img', images, filename)
-            save_.saveMask('data/rdy/masks', masks, filename)
+            split = ParallelSplit(input_size, split_size, workers)
+            split.splitSaveImages(split_images, 'data/rdy/img', filename)
+            split.splitSaveMasks(split_masks, 'data/rdy/masks', filename)
 
 
         proof = Proof('data/rdy/img', 'data/rdy/masks')
@@ -71,6 +72,10 @@ if __name__ == '__main__':
     parser.add_argument('--splitsize', default=None, type=int)
     parser.add_argument('--utmtilesize', default=1000, type=int)
     parser.add_argument('--pct_empty', default= 0.1, type=float)
+    parser.add_argument('--sourcemode', default='manifest', choices=['manifest', 'symlink', 'hardlink', 'copy'], help='runtype all: how the matched tifs are passed to the split: manifest (list of paths), symlink, hardlink or copy')
+    parser.add_argument('--maskformat', default='uint8', choices=['uint8', 'packbits'], help='runtype all: storage of the intermediate masks: uint8 (.npy) or packbits (.packed.npy, 1 bit/px)')
+    parser.add_argument('--restart', action='store_true', help='runtype stream: remove the crops and load/manifest.jsonl of the previous run and start with the first tile')
+    parser.add_argument('--workers', default=1, type=int, help='processes splitting and saving the images/masks, 0: all cores')
 
     args = parser.parse_args()
 
@@ -83,10 +88,15 @@ if __name__ == '__main__':
     split_size = args.splitsize
     utm_size = args.utmtilesize
     pct_empty = args.pct_empty
+    workers = args.workers or None
+    source_mode = args.sourcemode
+    mask_format = args.maskformat
 
     if run_type == 'all':
-            Run.runAll(geotif, geojson, input_size, split_size, utm_size, pct_empty)
+            Run.runAll(geotif, geojson, input_size, split_size, utm_size, pct_empty, workers, source_mode, mask_format)
+    elif run_type == 'stream':
+            Run.runStream(geotif, geojson, input_size, split_size, utm_size, pct_empty, not args.restart)
     elif run_type == 'split':
-            Run.runSplit(split_images, split_masks, geojson, input_size, split_size, pct_empty)
+            Run.runSplit(split_images, split_masks, geojson, input_size, split_size, pct_empty, workers)
     else:
-        print('Please enter correct --runtype all/split')
\ No newline at end of file
+        print('Please enter correct --runtype all/stream/split')
\ No newline at end of file
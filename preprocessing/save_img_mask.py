@@ -9,6 +9,13 @@ class Save:
         for image in tqdm(images, desc=f'Saving {json_file} images'):
             image[0].save(f'{folder_path}/{image[1]}_{image[2]}_{json_file}.png')
 
+    def saveImgIter(self, folder_path, images, json_file):
+        # saves every image while passing it on, for images that are streamed (e.g. into the prediction)
+        if not os.path.isdir(folder_path): os.makedirs(folder_path)
+        for image in images:
+            image[0].save(f'{folder_path}/{image[1]}_{image[2]}_{json_file}.png')
+            yield image
+
 
     def saveMask(self, folder_path, masks, json_file):
         if not os.path.isdir(folder_path): os.makedirs(folder_path)
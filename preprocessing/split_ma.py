@@ -3,6 +3,8 @@ import numpy as np
 import os
 from pathlib import Path
 
+from split_return import openMask, maskWindow
+
 #only tested with 2500x2500 to 1024x1024 images
 class Split:
     def __init__(self, in_size = 2500, dest_size = 1024):
@@ -55,11 +57,12 @@ class Split:
         if not split_folder.exists(): split_folder.mkdir()
         if not mask_folder.exists(): mask_folder.mkdir()
         for filename in os.listdir(mask_filepath):
-            mask = np.load(f"{mask_filepath}/{filename}")
+            #.npy or bit-packed .packed.npy (--maskformat packbits), memory-mapped
+            mask, packed = openMask(f"{mask_filepath}/{filename}")
 
             q = 0
             for coos in self.split_coos_:
-                new_mask = mask[coos[1]:coos[3],coos[0]:coos[2]]
+                new_mask = maskWindow(mask, packed, coos)
                 split_filename = filename.split('.')
                 mask_name = split_filename[0]
                 np.save(mask_folder/f"{mask_name}_{q}.npy",new_mask)
@@ -3,8 +3,40 @@ import numpy as np
 import os
 from pathlib import Path
 import rasterio
+from rasterio.windows import Window
 from tqdm import tqdm
 
+def listSources(sources):
+    #sources: folder, manifest (.txt, one path per line) or list of paths --> sorted list of the file paths
+    if isinstance(sources, (list, tuple)):
+        return sorted(sources)
+    if os.path.isfile(sources):
+        with open(sources, 'r') as f:
+            return sorted(line.strip() for line in f if line.strip())
+    return [f"{sources}/{filename}" for filename in sorted(os.listdir(sources))]
+
+def maskPath(mask_folder, mask_name):
+    #<mask_name>.packed.npy (bit-packed) if it exists, else <mask_name>.npy
+    packed = f"{mask_folder}/{mask_name}.packed.npy"
+    return packed if os.path.isfile(packed) else f"{mask_folder}/{mask_name}.npy"
+
+def openMask(mask_file):
+    #memory-maps a mask --> (array, packed), <name>.packed.npy: rows bit-packed with np.packbits(axis=1)
+    return np.load(mask_file, mmap_mode='r'), mask_file.endswith('.packed.npy')
+
+def maskWindow(mask, packed, coos):
+    #window coos (xmin, ymin, xmax, ymax in px) of an opened mask as uint8 0/1, only the rows of the window are read (and unpacked)
+    if packed:
+        return np.unpackbits(mask[coos[1]:coos[3]], axis=1, count=coos[2])[:, coos[0]:]
+    return (mask[coos[1]:coos[3], coos[0]:coos[2]] > 0).astype(np.uint8)
+
+def loadMask(mask_file, width=None):
+    #whole mask as uint8 0/1, width of a packed mask defaults to its height (square tiles)
+    mask, packed = openMask(mask_file)
+    if packed:
+        return np.unpackbits(mask, axis=1, count=width or mask.shape[0])
+    return (mask > 0).astype(np.uint8)
+
 #only tested with 2500x2500 images
 class Split:
     def __init__(self, in_size = 2500, dest_size = 1024, artificial_overlap = 0):
@@ -48,10 +80,11 @@ class Split:
     def splitImages(self, image_filepath):
         images = []
         geo_infos = {}
-        for filename in tqdm(os.listdir(image_filepath), desc="Splitting images"):
-            im = Image.open(f"{image_filepath}/{filename}")
-            tiff = rasterio.open(f"{image_filepath}/{filename}")
-            tiff_coos = tiff.bounds #xmin=0,ymin=1,xmax=2,ymax=3 (utm32)
+        for image_file in tqdm(listSources(image_filepath), desc="Splitting images"):
+            filename = os.path.basename(image_file)
+            im = Image.open(image_file)
+            with rasterio.open(image_file) as tiff:
+                tiff_coos = tiff.bounds #xmin=0,ymin=1,xmax=2,ymax=3 (utm32)
             q = 0
             for coos in self.split_coos_:
                 image_name = filename.split('.')[0]
@@ -61,15 +94,40 @@ class Split:
                 q += 1
         
         return images, geo_infos
+
+    def splitGeoInfos(self, image_filepath):
+        # geo_infos of all splits of all images, only the headers are read
+        geo_infos = {}
+        for image_file in listSources(image_filepath):
+            image_name = os.path.basename(image_file).split('.')[0]
+            with rasterio.open(image_file) as tiff:
+                tiff_coos = tiff.bounds #xmin=0,ymin=1,xmax=2,ymax=3 (utm32)
+            for q, coos in enumerate(self.split_coos_):
+                geo_infos.update(self.splitImgGeoInfo(f'{image_name}_{q}_', tiff_coos, coos))
+        return geo_infos
+
+    def iterImages(self, image_filepath, needed=None):
+        # lazy version of splitImages: yields (array HxWxC, image_name, q, geo_info) reading only the window of each split,
+        # memory stays constant regardless of the number of images. needed: optional set of <image_name>_<q>_ to read, others are skipped
+        for image_file in listSources(image_filepath):
+            image_name = os.path.basename(image_file).split('.')[0]
+            with rasterio.open(image_file) as tiff:
+                tiff_coos = tiff.bounds #xmin=0,ymin=1,xmax=2,ymax=3 (utm32)
+                for q, coos in enumerate(self.split_coos_):
+                    if needed is not None and f'{image_name}_{q}_' not in needed:
+                        continue
+                    window = Window(coos[0], coos[1], coos[2]-coos[0], coos[3]-coos[1])
+                    array = np.moveaxis(tiff.read(window=window), 0, -1)
+                    yield array, image_name, q, self.splitImgGeoInfo(image_name, tiff_coos, coos)[image_name]
     
     def splitMask(self, mask_filepath):
         masks = []
         for filename in os.listdir(mask_filepath):
-            mask = np.load(f"{mask_filepath}/{filename}")
+            mask, packed = openMask(f"{mask_filepath}/{filename}")
             q = 0
             for coos in self.split_coos_:
                 mask_name = filename.split('.')[0]
-                new_mask = mask[coos[1]:coos[3],coos[0]:coos[2]]
+                new_mask = maskWindow(mask, packed, coos)
                 masks.append((new_mask,mask_name,q))
                 q += 1
         
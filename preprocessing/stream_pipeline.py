@@ -0,0 +1,173 @@
+import hashlib
+import json
+import os
+import shutil
+from PIL import Image
+from tqdm import tqdm
+
+from load_munich_ma import LoadMunich
+from masks import MaskMaker
+from split_return import Split
+
+def hashFraction(text):
+    # deterministic, uniformly distributed number in [0, 1) from the hash of text (the same in every run)
+    return int.from_bytes(hashlib.sha1(text.encode()).digest()[:8], 'big') / 2 ** 64
+
+def assignSet(name, train=0.85, val=0.05):
+    # train/eval/test set of a crop from the hash of its name (same shares as TrainTestSplit):
+    # independent of the order and number of crops, so it is the same after a resume and image + mask always land in the same set
+    h = hashFraction(name)
+    if h < train:
+        return 'train'
+    if h < train + val:
+        return 'eval'
+    return 'test'
+
+
+class StreamPipeline:
+    """
+    runAll in one pass over the images: every tile goes mask -> split -> emptiness check -> train/eval/test assignment -> PNG in load/,
+    nothing is copied or saved in between. Every finished tile is appended to <dst_path>/manifest.jsonl,
+    an interrupted run continues with the first tile that is not in there.
+    Empty crops (< min_pixels PV pixels): as by Proof, int(pct_empty * non-empty crops) of them are kept, drawn uniformly over all tiles.
+    The draw takes the empty crops with the smallest hashes of their names, counted in a first pass over the masks only (no image is read),
+    so it is the same after a resume. The manifest holds the empty crops of every finished tile, so a resume only burns the masks of the remaining tiles.
+    """
+
+    def __init__(self, geotif, input_size, split_size, utm_size, pct_empty=0.1, dst_path='load', min_pixels=20):
+        self.geotif_ = geotif
+        self.image_size_ = (input_size, input_size)
+        self.utm_size_ = (utm_size, utm_size)
+        self.split_ = Split(input_size, split_size)
+        self.pct_empty_ = pct_empty
+        self.dst_path_ = dst_path
+        self.min_pixels_ = min_pixels
+        self.manifest_path_ = f'{dst_path}/manifest.jsonl'
+        self.not_empty_ = 0
+        self.kept_empty_ = 0
+        self.written_ = {'train': 0, 'eval': 0, 'test': 0}
+        # empty crops with hashFraction('empty_<name>') <= empty_threshold_ are kept (set by selectEmpty)
+        self.empty_threshold_ = -1.0
+
+    def outputFolders(self):
+        return [f'{self.dst_path_}/{folder}/{dst_set}' for folder in ('img', 'masks') for dst_set in self.written_]
+
+    def loadManifest(self, resume=True):
+        # returns {finished (geojson, tile): (non-empty crops, q of the empty crops) or None} and restores the counters of the last finished tile
+        if not resume:
+            # restart: the crops of the previous run are removed with its manifest, so no old crops mix into the new data
+            for folder in self.outputFolders():
+                shutil.rmtree(folder, ignore_errors=True)
+            if os.path.isfile(self.manifest_path_):
+                os.remove(self.manifest_path_)
+        for folder in self.outputFolders():
+            os.makedirs(folder, exist_ok=True)
+        done = {}
+        if not os.path.isfile(self.manifest_path_):
+            if any(os.listdir(folder) for folder in self.outputFolders()):
+                raise RuntimeError(f'{self.dst_path_} contains crops without a {self.manifest_path_} (e.g. of runAll), '
+                                   'empty it or start with restart (--restart)')
+            return done
+        with open(self.manifest_path_, 'r') as f:
+            lines = f.readlines()
+        valid = []
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # last line cut off by the interruption: dropped, the tile is done again
+                break
+            valid.append(line)
+            # manifests without the crop counts of the tile: its mask is burned again for the count
+            done[(entry['geojson'], entry['tile'])] = (entry['tile_not_empty'], entry['tile_empty']) if 'tile_empty' in entry else None
+            self.not_empty_, self.kept_empty_, self.written_ = entry['not_empty'], entry['kept_empty'], entry['written']
+        if len(valid) < len(lines) or (valid and not valid[-1].endswith('\n')):
+            with open(self.manifest_path_, 'w') as f:
+                f.write(''.join(line if line.endswith('\n') else line + '\n' for line in valid))
+        return done
+
+    def appendManifest(self, geojson_name, tile, tile_counts):
+        tile_not_empty, tile_empty = tile_counts
+        with open(self.manifest_path_, 'a') as f:
+            f.write(json.dumps({'geojson': geojson_name, 'tile': tile, 'not_empty': self.not_empty_,
+                                'kept_empty': self.kept_empty_, 'written': self.written_,
+                                'tile_not_empty': tile_not_empty, 'tile_empty': tile_empty}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+    def tilePolygons(self, geojson_file, geojson_name):
+        # {tile filename: polygons in pixel coordinates} of all tiles with PV polygons, no tifs are copied
+        loader = LoadMunich(self.geotif_, geojson_file, geojson_name, self.image_size_, self.utm_size_)
+        polygon_images, polygon_pixels = loader.buildReadData(loader.readTifKoos(), loader.readGeoJsonPoly())
+        return {tile: [polygon_pixels[key] for key in keys] for tile, keys in polygon_images[geojson_name].items()}
+
+    def tileCrops(self, tile, polygons, geojson_name):
+        # (name, coos, mask crop, empty) of all crops of the tile, only the mask is made
+        mask = MaskMaker.burn_mask(polygons, self.image_size_)
+        crops = []
+        for q, coos in enumerate(self.split_.split_coos_):
+            mask_crop = mask[coos[1]:coos[3], coos[0]:coos[2]]
+            crops.append((f"{tile.split('.')[0]}_{q}_{geojson_name}", coos, mask_crop, mask_crop.sum() < self.min_pixels_))
+        return crops
+
+    @staticmethod
+    def cropCounts(crops):
+        # (non-empty crops, q of the empty crops) of the crops of one tile, as stored in the manifest
+        return sum(not is_empty for *_, is_empty in crops), [q for q, (*_, is_empty) in enumerate(crops) if is_empty]
+
+    def selectEmpty(self, tiles, done=None):
+        """
+        First pass over the masks of all tiles ({geojson_name: {tile: polygons}}, no image is read):
+        keeps the int(pct_empty * non-empty crops) empty crops with the smallest hashes, a uniform draw as Proof's, but reproducible.
+        done: the finished tiles of loadManifest, their crop counts are taken from the manifest instead of burning their masks again
+        """
+        done = done or {}
+        not_empty = 0
+        empty_hashes = []
+        for geojson_name in tiles:
+            for tile in tqdm(sorted(tiles[geojson_name]), desc=f'Counting empty crops {geojson_name}'):
+                counts = done.get((geojson_name, tile))
+                if counts is None:
+                    counts = self.cropCounts(self.tileCrops(tile, tiles[geojson_name][tile], geojson_name))
+                tile_not_empty, tile_empty = counts
+                not_empty += tile_not_empty
+                empty_hashes.extend(hashFraction(f"empty_{tile.split('.')[0]}_{q}_{geojson_name}") for q in tile_empty)
+        n_keep = min(int(not_empty * self.pct_empty_), len(empty_hashes))
+        self.empty_threshold_ = sorted(empty_hashes)[n_keep - 1] if n_keep else -1.0
+        return n_keep
+
+    def processTile(self, tile, polygons, geojson_name):
+        crops = self.tileCrops(tile, polygons, geojson_name)
+        with Image.open(f'{self.geotif_}/{tile}') as im:
+            for name, coos, mask_crop, is_empty in crops:
+                if is_empty:
+                    if hashFraction(f'empty_{name}') > self.empty_threshold_:
+                        continue
+                    self.kept_empty_ += 1
+                else:
+                    self.not_empty_ += 1
+                dst_set = assignSet(name)
+                im.crop(coos).save(f'{self.dst_path_}/img/{dst_set}/{name}.png')
+                Image.fromarray(mask_crop > 0).save(f'{self.dst_path_}/masks/{dst_set}/{name}.png')
+                self.written_[dst_set] += 1
+        return self.cropCounts(crops)
+
+    def run(self, geojson, resume=True):
+        done = self.loadManifest(resume)
+        tiles = {}
+        for geojson_file in sorted(os.listdir(geojson)):
+            geojson_name = geojson_file.split('.')[0]
+            tiles[geojson_name] = self.tilePolygons(f'{geojson}/{geojson_file}', geojson_name)
+        self.selectEmpty(tiles, done)
+
+        for geojson_name in tiles:
+            todo = [tile for tile in sorted(tiles[geojson_name]) if (geojson_name, tile) not in done]
+            if len(todo) < len(tiles[geojson_name]):
+                print(f'{geojson_name}: {len(tiles[geojson_name]) - len(todo)} of {len(tiles[geojson_name])} tiles already done, resuming')
+            for tile in tqdm(todo, desc=f'Processing {geojson_name}'):
+                tile_counts = self.processTile(tile, tiles[geojson_name][tile], geojson_name)
+                self.appendManifest(geojson_name, tile, tile_counts)
+
+        print(f'{self.not_empty_} not empty crops, {self.kept_empty_} empty crops kept, written (train/eval/test): '
+              f"{self.written_['train']}/{self.written_['eval']}/{self.written_['test']}")
+        return self.written_
\ No newline at end of file
@@ -93,6 +93,7 @@ def eval_psnr(loader, model, data_norm=None, eval_type=None, eval_bsize=None,
 
     pbar = tqdm(loader, leave=False, desc='val')
     nr = 0
+    timer = utils.Timer()
     for batch in pbar:
         for k, v in batch.items():
             batch[k] = v.cuda()
@@ -102,25 +103,24 @@ def eval_psnr(loader, model, data_norm=None, eval_type=None, eval_bsize=None,
         pred = torch.sigmoid(model.infer(inp))
 
         cpu_pred = pred.cpu()
-        vector_temp = cpu_pred.detach().squeeze().numpy()
-
-        filepath = loader.dataset.dataset.dataset_1.files[nr]
-        nr += 1
-        last = filepath.split('/')[-1]
-        file_name = last.split('.')[0]
-        save_path_img = 'test/dv'
-        save_path_np = 'test/numpy'
-        try:
-            np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
-            
-        except:
-            os.makedirs(save_path_np)
-            np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
-        try:
-            plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
-        except:
-            os.makedirs(save_path_img)
-            plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
+        for vector_temp in cpu_pred.detach()[:, 0].numpy():
+            filepath = loader.dataset.dataset.dataset_1.files[nr]
+            nr += 1
+            last = filepath.split('/')[-1]
+            file_name = last.split('.')[0]
+            save_path_img = 'test/dv'
+            save_path_np = 'test/numpy'
+            try:
+                np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
+
+            except:
+                os.makedirs(save_path_np)
+                np.save(f'{save_path_np}/{file_name}.npy',vector_temp)
+            try:
+                plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
+            except:
+                os.makedirs(save_path_img)
+                plt.imsave(f'{save_path_img}/{file_name}.png',vector_temp, cmap=cm.gray)
 
         result1, result2, result3, result4 = metric_fn(pred, batch['gt'])
         val_metric1.add(result1.item(), inp.shape[0])
@@ -134,6 +134,9 @@ def eval_psnr(loader, model, data_norm=None, eval_type=None, eval_bsize=None,
             pbar.set_description('val {} {:.4f}'.format(metric3, val_metric3.item()))
             pbar.set_description('val {} {:.4f}'.format(metric4, val_metric4.item()))
 
+    t = timer.t()
+    print(f'{nr} tiles in {utils.time_text(t)} ({nr / t:.2f} tiles/s)')
+
     return val_metric1.item(), val_metric2.item(), val_metric3.item(), val_metric4.item()
 
 
@@ -143,6 +146,7 @@ if __name__ == '__main__':
         parser.add_argument('--config')
         parser.add_argument('--model')
         parser.add_argument('--prompt', default='none')
+        parser.add_argument('--batch-size', type=int, default=None, help='default: test_dataset batch_size of the config')
         args = parser.parse_args()
     
         with open(args.config, 'r') as f:
@@ -150,7 +154,7 @@ if __name__ == '__main__':
         spec = config['test_dataset']
         dataset = datasets.make(spec['dataset'])
         dataset = datasets.make(spec['wrapper'], args={'dataset': dataset})
-        loader = DataLoader(dataset, batch_size=spec['batch_size'],
+        loader = DataLoader(dataset, batch_size=args.batch_size or spec['batch_size'],
                             num_workers=8)
     
         model = models.make(config['model']).cuda()